@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Per-process memory budget for image work (each gunicorn worker gets its own controller)
+MEMORY_BUDGET_MB = int(os.getenv('ADMISSION_MEMORY_BUDGET_MB', '512'))
+QUEUE_LIMIT = int(os.getenv('ADMISSION_QUEUE_LIMIT', '8'))
+QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '30'))
+
+# Bytes per pixel held at the peak of each pipeline. Encrypt: Pillow RGB (4), array
+# view and shifted output (3 + 3), PNG source copy (4), PNG buffer and Fernet token.
+# Decrypt still builds the entropy grayscale list (~9) before unshifting.
+PEAK_BYTES_PER_PIXEL = {
+    'encrypt': 32,
+    'decrypt': 48,
+}
+FIXED_OVERHEAD_BYTES = 4 * 1024 * 1024
+
+# Decoded bytes per pixel for common Pillow modes (source image before convert('RGB'))
+MODE_BYTES_PER_PIXEL = {
+    '1': 1, 'L': 1, 'P': 1, 'LA': 2, 'PA': 2, 'I;16': 2,
+    'RGB': 3, 'YCbCr': 3, 'LAB': 3, 'HSV': 3,
+    'RGBA': 4, 'RGBX': 4, 'CMYK': 4, 'I': 4, 'F': 4,
+}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_peak_bytes(size, mode, operation='encrypt'):
+    """Estimate peak memory for processing an image from its header (size, mode) alone"""
+    width, height = size
+    pixels = width * height
+    source_bytes = pixels * MODE_BYTES_PER_PIXEL.get(mode, 4)
+    return FIXED_OVERHEAD_BYTES + source_bytes + pixels * PEAK_BYTES_PER_PIXEL[operation]
+
+
+class AdmissionController:
+    """
+    Admits, queues or rejects requests against a memory budget.
+    Waiters are served in FIFO order so large requests are not starved by small ones.
+    """
+
+    def __init__(self, budget_bytes, queue_limit=QUEUE_LIMIT, queue_timeout=QUEUE_TIMEOUT):
+        self.budget_bytes = budget_bytes
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._waiters = deque()
+        self._in_use = 0
+        self._active = 0
+        self._admitted = 0
+        self._queued = 0
+        self._rejected = 0
+
+    def acquire(self, cost, held=0):
+        """
+        Admit a request needing cost bytes. held is what the same request already
+        holds (a later frame needing more): only the difference is reserved, and
+        release() is then called once with the new total.
+        """
+        extra = cost - held
+        with self._cond:
+            if cost > self.budget_bytes:
+                self._rejected += 1
+                raise AdmissionRejected(
+                    f"Image too large: needs ~{cost // (1024 * 1024)}MB, budget is {self.budget_bytes // (1024 * 1024)}MB",
+                    retry_after=0,
+                )
+
+            if not self._waiters and self._in_use + extra <= self.budget_bytes:
+                self._grant(extra, new=not held)
+                return
+
+            if len(self._waiters) >= self.queue_limit:
+                self._rejected += 1
+                raise AdmissionRejected("Server busy: admission queue is full")
+
+            ticket = object()
+            self._waiters.append(ticket)
+            self._queued += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self._waiters[0] is not ticket or self._in_use + extra > self.budget_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected += 1
+                        raise AdmissionRejected("Server busy: timed out waiting for memory")
+                    self._cond.wait(remaining)
+                self._grant(extra, new=not held)
+            finally:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+
+    def release(self, cost):
+        with self._cond:
+            self._in_use -= cost
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _grant(self, cost, new=True):
+        self._in_use += cost
+        if new:
+            self._active += 1
+            self._admitted += 1
+
+    @contextmanager
+    def admit(self, cost):
+        self.acquire(cost)
+        try:
+            yield
+        finally:
+            self.release(cost)
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'budget_bytes': self.budget_bytes,
+                'in_use_bytes': self._in_use,
+                'active': self._active,
+                'queue_depth': len(self._waiters),
+                'admitted_total': self._admitted,
+                'queued_total': self._queued,
+                'rejected_total': self._rejected,
+            }
+
+
+# Global instance
+admission_controller = AdmissionController(MEMORY_BUDGET_MB * 1024 * 1024)
@@ -1,18 +1,30 @@
-from flask import Flask, request, jsonify, send_file, session
+from flask import Flask, Response, request, jsonify, send_file, session, stream_with_context
 from flask_cors import CORS
 import os
 import sys
 import traceback
 from dotenv import load_dotenv
 from web_encryption import encrypt_image_web
-from web_decryption import decrypt_image_web
+from web_decryption import decrypt_image_web, output_base_name
 from key_utils import log_event, check_pin_strength
+from log_store import CSV_HEADER, export_csv, export_ndjson, get_log_store, iter_export_rows
 from firebase_service import firebase_service
+from container import DEFAULT_HASH_ALGO, HASH_ALGORITHMS, atomic_output
+from admission import AdmissionRejected, admission_controller
+from chunked_upload import ChunkedUploadStore, UploadError
+from multipart_stream import ContainerFeed, FormError, ImageFeed, StagedPart, parse_form
+from content_store import ContentStore, file_sha256
+from container import ContainerError, read_container_header
+from verify import verify_container
+from rekey import rekey_stream
+from cryptography.fernet import InvalidToken
 from PIL import Image
 import tempfile
+import shutil
 from datetime import datetime
 import io
 import base64
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
 # Force unbuffered output for debugging
@@ -78,8 +90,9 @@ CORS(app, origins=[
 # This matches the path used in web_encryption.py
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 UPLOAD_FOLDER = os.path.join(ROOT_DIR, 'uploads')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'tif', 'tiff'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+LOG_VIEW_LIMIT = int(os.getenv('LOG_VIEW_LIMIT', '1000'))
 
 # Ensure uploads directory exists (use absolute path for Render/cloud hosting)
 try:
@@ -91,9 +104,30 @@ try:
 except Exception as e:
     print(f"⚠️ Warning: Could not create upload folder: {e}")
 
+# Resumable uploads are staged per upload id until finalized
+upload_store = ChunkedUploadStore(os.path.join(UPLOAD_FOLDER, '.staging'))
+# Outputs are deduplicated by input digest + PIN + parameters, so retries skip the work
+content_store = ContentStore(os.path.join(UPLOAD_FOLDER, '.store')) if os.getenv('CONTENT_STORE', '1') != '0' else None
+# /encrypt and /decrypt parse multipart bodies as they arrive instead of via request.files
+STREAMING_UPLOADS = os.getenv('STREAMING_UPLOADS', '1') != '0'
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def upload_error_response(error):
+    body = {'error': str(error)}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return jsonify(body), error.status
+
+def overloaded_response(result):
+    # 413 when the image can never fit the memory budget, 503 + Retry-After when busy
+    if result.get('retry_after') == 0:
+        return jsonify({'error': result['error']}), 413
+    response = jsonify({'error': result['error']})
+    response.headers['Retry-After'] = str(result.get('retry_after', 1))
+    return response, 503
+
 @app.route('/')
 def index():
     return jsonify({
@@ -103,9 +137,16 @@ def index():
             '/check_pin_strength',
             '/encrypt',
             '/decrypt',
+            '/verify',
+            '/rekey',
+            '/uploads',
+            '/uploads/<upload_id>',
+            '/uploads/<upload_id>/finalize',
             '/download/<filename>',
             '/authenticate_logs',
-            '/get_logs'
+            '/get_logs',
+            '/export_logs',
+            '/metrics'
         ]
     })
 
@@ -116,6 +157,196 @@ def check_pin_strength_route():
     strength = check_pin_strength(pin)
     return jsonify({'strength': strength})
 
+def staging_dir():
+    """Request-private directory for uploads: clients choose filenames, so uploads/ itself is shared"""
+    return tempfile.mkdtemp(dir=UPLOAD_FOLDER, prefix='.in-')
+
+def discard_staged(path):
+    """Remove an uploaded file, and its directory if staging_dir() made it"""
+    directory = os.path.dirname(path)
+    if os.path.basename(directory).startswith('.in-'):
+        shutil.rmtree(directory, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def save_upload(file, path):
+    """Save an uploaded file by rename, never by truncating: the name may be a content store link"""
+    with atomic_output(path) as out:
+        file.save(out)
+
+def publish_result(key, private_path, public_name, meta):
+    """Adopt a request-private output into the store and link its public name to it; returns the object's path"""
+    object_path = content_store.put(key, private_path, meta)
+    if not content_store.link(key, os.path.join(UPLOAD_FOLDER, public_name)):
+        os.replace(private_path, os.path.join(UPLOAD_FOLDER, public_name))
+    return object_path
+
+def encrypt_cached(temp_path, pin, hash_algo, scramble, image=None, input_digest=None):
+    """encrypt_image_web, answered from the content store when the same input was already encrypted"""
+    if content_store is None:
+        return encrypt_image_web(temp_path, pin, hash_algo=hash_algo, admission=admission_controller, scramble=scramble,
+                                 image=image)
+
+    key = content_store.key_for('encrypt', input_digest or file_sha256(temp_path), pin, hash_algo=hash_algo, scramble=scramble)
+    encrypted_filename = f"{os.path.splitext(os.path.basename(temp_path))[0]}_encrypted.enc"
+    with content_store.lock(key):
+        entry = content_store.lookup(key)
+        if entry and content_store.link(key, os.path.join(UPLOAD_FOLDER, encrypted_filename)):
+            print(f"♻️ Duplicate submission, serving stored result", file=sys.stderr, flush=True)
+            log_event(f"Web encryption served from content store: {encrypted_filename}")
+            return {'success': True, 'encrypted_filename': encrypted_filename, 'output_path': entry['path'],
+                    'stats': entry['stats'], 'deduplicated': True}
+
+        # Computed in a private directory: the public name comes from the client's filename,
+        # so another request may be writing it, and only our own output may enter the store
+        work_dir = tempfile.mkdtemp(dir=UPLOAD_FOLDER, prefix='.work-')
+        try:
+            result = encrypt_image_web(temp_path, pin, hash_algo=hash_algo, admission=admission_controller,
+                                       scramble=scramble, image=image, output_dir=work_dir)
+            if result.get('success'):
+                result['output_path'] = publish_result(key, os.path.join(work_dir, result['encrypted_filename']),
+                                                       result['encrypted_filename'], {'stats': result['stats']})
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return result
+
+def encrypt_response(temp_path, pin, hash_algo, scramble, image=None, input_digest=None):
+    """Encrypt an uploaded file staged at temp_path (removed afterwards) and build the JSON response"""
+    # Encrypt the image
+    print(f"🔐 Starting encryption...", file=sys.stderr, flush=True)
+    result = encrypt_cached(temp_path, pin, hash_algo, scramble, image, input_digest)
+    print(f"✅ Encryption completed. Success: {result.get('success')}", file=sys.stderr, flush=True)
+    
+    if not result.get('success'):
+        error_msg = result.get('error', 'Unknown encryption error')
+        print(f"❌ Encryption failed with error: {error_msg}", file=sys.stderr, flush=True)
+    
+    # Clean up original file
+    discard_staged(temp_path)
+    
+    if result['success']:
+        # Read encrypted file for direct download (APK compatibility); the stored object when
+        # there is one, since the public name can be replaced by a request with the same filename
+        encrypted_path = result.get('output_path') or os.path.join(UPLOAD_FOLDER, result['encrypted_filename'])
+        
+        encrypted_data = None
+        # The digest is embedded in the container; meta_data is kept for older clients
+        meta_data = result['stats']['original_hash']
+        
+        try:
+            # Read file into memory for APK clients
+            if os.path.exists(encrypted_path):
+                with open(encrypted_path, 'rb') as f:
+                    encrypted_data = base64.b64encode(f.read()).decode('utf-8')
+        except Exception as e:
+            print(f"⚠️ Warning: Could not read files for base64 encoding: {e}", file=sys.stderr, flush=True)
+        
+        response = {
+            'success': True,
+            'encrypted_filename': result['encrypted_filename'],
+            'encrypted_data': encrypted_data,  # Base64 for APK
+            'meta_data': meta_data,  # Hash string for APK
+            'stats': result['stats'],
+            'deduplicated': result.get('deduplicated', False)
+        }
+        # Only when a legacy sidecar was actually written, so /download/<meta_filename> exists
+        if result.get('meta_filename'):
+            response['meta_filename'] = result['meta_filename']
+        return jsonify(response)
+    elif result.get('overloaded'):
+        return overloaded_response(result)
+    else:
+        return jsonify({'error': result['error']}), 500
+
+def parse_streaming_form(open_part):
+    """parse_form over the request body; a declared Content-Length over the limit fails before any read"""
+    try:
+        stream = request.stream
+    except RequestEntityTooLarge:
+        raise FormError('File too large', 413)
+    return parse_form(stream, request.content_type, open_part, app.config['MAX_CONTENT_LENGTH'])
+
+def encrypt_streaming():
+    """/encrypt from request.stream: the image is staged, hashed and decoded while it uploads"""
+    feed = ImageFeed(admission=admission_controller)
+    stage_dir = staging_dir()
+
+    def open_part(name, filename, fields):
+        if name != 'image':
+            return None
+        if not filename:
+            raise FormError('No file selected')
+        if not allowed_file(filename):
+            raise FormError('Invalid file type. Only PNG, JPG, JPEG, GIF, TIFF allowed')
+        return StagedPart(os.path.join(stage_dir, secure_filename(filename)), feed)
+
+    try:
+        try:
+            fields, parts = parse_streaming_form(open_part)
+        except FormError as e:
+            print(f"❌ Upload rejected: {e}", file=sys.stderr, flush=True)
+            return jsonify({'error': str(e)}), e.status
+        except AdmissionRejected as e:
+            log_event(f"Web encryption rejected: {str(e)}")
+            return overloaded_response({'error': str(e), 'retry_after': e.retry_after})
+
+        part = parts.get('image')
+        pin = fields.get('pin')
+        hash_algo = fields.get('hash_algo', DEFAULT_HASH_ALGO)
+        scramble = fields.get('scramble', '').lower() in ('1', 'true', 'yes', 'on')
+        if part is None:
+            return jsonify({'error': 'No image file provided'}), 400
+        if not pin:
+            return jsonify({'error': 'PIN is required'}), 400
+        if hash_algo not in HASH_ALGORITHMS:
+            return jsonify({'error': f"Unsupported hash_algo. Use one of: {', '.join(HASH_ALGORITHMS)}"}), 400
+
+        print(f"✅ Streamed {part.size} bytes to {part.path} (decoded while uploading: {feed.image is not None})",
+              file=sys.stderr, flush=True)
+        return encrypt_response(part.path, pin, hash_algo, scramble, image=feed.image, input_digest=part.sha256)
+    finally:
+        feed.release()
+        shutil.rmtree(stage_dir, ignore_errors=True)
+
+def decrypt_streaming():
+    """/decrypt from request.stream: the container is staged, hashed and (PIN sent first) decrypted while it uploads"""
+    feeds = {}
+    stage_dir = staging_dir()
+
+    def open_part(name, filename, fields):
+        if name == 'encrypted_file':
+            if not filename:
+                raise FormError('No file selected')
+            feeds['container'] = ContainerFeed(fields['pin']) if fields.get('pin') else None
+            return StagedPart(os.path.join(stage_dir, secure_filename(filename)), feeds['container'])
+        # Legacy .meta sidecar, as its own field or any uploaded *.meta file
+        if filename and (name == 'meta_file' or filename.endswith('.meta')):
+            return StagedPart(os.path.join(stage_dir, secure_filename(filename)))
+        return None
+
+    try:
+        try:
+            fields, parts = parse_streaming_form(open_part)
+        except FormError as e:
+            return jsonify({'error': str(e)}), e.status
+
+        part = parts.pop('encrypted_file', None)
+        meta_part = parts.pop('meta_file', None) or next(iter(parts.values()), None)
+        pin = fields.get('pin')
+        if part is None:
+            return jsonify({'error': 'No encrypted file provided'}), 400
+        if not pin:
+            return jsonify({'error': 'PIN is required'}), 400
+
+        meta_path = part.path + '.meta'
+        if meta_part is not None and meta_part.path != meta_path:
+            os.replace(meta_part.path, meta_path)
+        feed = feeds.get('container')
+        return decrypt_response(part.path, pin, meta_path, plaintext=feed.plaintext if feed else None,
+                                input_digest=part.sha256)
+    finally:
+        shutil.rmtree(stage_dir, ignore_errors=True)
+
 @app.route('/encrypt', methods=['POST'])
 def encrypt_route():
     try:
@@ -125,6 +356,9 @@ def encrypt_route():
         print(f"Content-Type: {request.content_type}", file=sys.stderr, flush=True)
         print(f"Content-Length: {request.content_length}", file=sys.stderr, flush=True)
         print(f"{'='*60}\n", file=sys.stderr, flush=True)
+
+        if STREAMING_UPLOADS and request.mimetype == 'multipart/form-data':
+            return encrypt_streaming()
         
         if 'image' not in request.files:
             print(f"❌ No 'image' in request.files. Available: {list(request.files.keys())}", file=sys.stderr, flush=True)
@@ -134,6 +368,8 @@ def encrypt_route():
         
         file = request.files['image']
         pin = request.form.get('pin')
+        hash_algo = request.form.get('hash_algo', DEFAULT_HASH_ALGO)
+        scramble = request.form.get('scramble', '').lower() in ('1', 'true', 'yes', 'on')
         
         print(f"📝 File details - filename: {file.filename}, content_type: {file.content_type}", file=sys.stderr, flush=True)
         print(f"📝 PIN received: {'Yes' if pin else 'No'} (length: {len(pin) if pin else 0})", file=sys.stderr, flush=True)
@@ -148,58 +384,19 @@ def encrypt_route():
         
         if not allowed_file(file.filename):
             print(f"❌ File type not allowed: {file.filename}", file=sys.stderr, flush=True)
-            return jsonify({'error': 'Invalid file type. Only PNG, JPG, JPEG allowed'}), 400
+            return jsonify({'error': 'Invalid file type. Only PNG, JPG, JPEG, GIF, TIFF allowed'}), 400
+        
+        if hash_algo not in HASH_ALGORITHMS:
+            return jsonify({'error': f"Unsupported hash_algo. Use one of: {', '.join(HASH_ALGORITHMS)}"}), 400
         
         # Save uploaded file temporarily
         filename = secure_filename(file.filename)
-        temp_path = os.path.join(UPLOAD_FOLDER, filename)
+        temp_path = os.path.join(staging_dir(), filename)
         print(f"💾 Saving to: {temp_path}", file=sys.stderr, flush=True)
-        file.save(temp_path)
+        save_upload(file, temp_path)
         print(f"✅ File saved successfully", file=sys.stderr, flush=True)
         
-        # Encrypt the image
-        print(f"🔐 Starting encryption...", file=sys.stderr, flush=True)
-        result = encrypt_image_web(temp_path, pin)
-        print(f"✅ Encryption completed. Success: {result.get('success')}", file=sys.stderr, flush=True)
-        
-        if not result.get('success'):
-            error_msg = result.get('error', 'Unknown encryption error')
-            print(f"❌ Encryption failed with error: {error_msg}", file=sys.stderr, flush=True)
-        
-        # Clean up original file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        
-        if result['success']:
-            # Read encrypted file and meta file for direct download (APK compatibility)
-            encrypted_path = os.path.join(UPLOAD_FOLDER, result['encrypted_filename'])
-            meta_path = os.path.join(UPLOAD_FOLDER, result['meta_filename'])
-            
-            encrypted_data = None
-            meta_data = None
-            
-            try:
-                # Read files into memory for APK clients
-                if os.path.exists(encrypted_path):
-                    with open(encrypted_path, 'rb') as f:
-                        encrypted_data = base64.b64encode(f.read()).decode('utf-8')
-                
-                if os.path.exists(meta_path):
-                    with open(meta_path, 'r') as f:
-                        meta_data = f.read()
-            except Exception as e:
-                print(f"⚠️ Warning: Could not read files for base64 encoding: {e}", file=sys.stderr, flush=True)
-            
-            return jsonify({
-                'success': True,
-                'encrypted_filename': result['encrypted_filename'],
-                'meta_filename': result['meta_filename'],
-                'encrypted_data': encrypted_data,  # Base64 for APK
-                'meta_data': meta_data,  # Hash string for APK
-                'stats': result['stats']
-            })
-        else:
-            return jsonify({'error': result['error']}), 500
+        return encrypt_response(temp_path, pin, hash_algo, scramble)
             
     except Exception as e:
         error_details = traceback.format_exc()
@@ -212,9 +409,67 @@ def encrypt_route():
         # Don't call log_event here as it might cause secondary errors
         return jsonify({'error': f'Encryption failed: {str(e)}'}), 500
 
+def decrypt_cached(temp_path, pin, meta_path=None, plaintext=None, input_digest=None):
+    """decrypt_image_web, answered from the content store when the same container was already decrypted"""
+    if content_store is None:
+        return decrypt_image_web(temp_path, pin, admission=admission_controller, plaintext=plaintext)
+
+    # A legacy .meta sidecar changes the integrity check, so its digest is part of the key
+    meta_digest = file_sha256(meta_path) if meta_path and os.path.exists(meta_path) else None
+    key = content_store.key_for('decrypt', input_digest or file_sha256(temp_path), pin, meta=meta_digest)
+    with content_store.lock(key):
+        entry = content_store.lookup(key)
+        if entry:
+            decrypted_filename = f"{output_base_name(temp_path)}_decrypted{entry['suffix']}"
+            if content_store.link(key, os.path.join(UPLOAD_FOLDER, decrypted_filename)):
+                with open(entry['path'], 'rb') as f:
+                    img_base64 = base64.b64encode(f.read()).decode('utf-8')
+                log_event(f"Web decryption served from content store: {decrypted_filename}")
+                return {'success': True, 'decrypted_image': img_base64, 'decrypted_filename': decrypted_filename,
+                        'stats': entry['stats'], 'deduplicated': True}
+
+        work_dir = tempfile.mkdtemp(dir=UPLOAD_FOLDER, prefix='.work-')
+        try:
+            result = decrypt_image_web(temp_path, pin, admission=admission_controller, plaintext=plaintext,
+                                       output_dir=work_dir)
+            if result.get('success'):
+                publish_result(key, os.path.join(work_dir, result['decrypted_filename']), result['decrypted_filename'], {
+                    'stats': result['stats'],
+                    'suffix': os.path.splitext(result['decrypted_filename'])[1],
+                })
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return result
+
+def decrypt_response(temp_path, pin, meta_path=None, plaintext=None, input_digest=None):
+    """Decrypt an uploaded container staged at temp_path (removed afterwards) and build the JSON response"""
+    # Decrypt the image
+    result = decrypt_cached(temp_path, pin, meta_path, plaintext, input_digest)
+    
+    # Clean up temporary files after decryption
+    if meta_path and os.path.exists(meta_path):
+        os.remove(meta_path)
+    discard_staged(temp_path)
+    
+    if result['success']:
+        return jsonify({
+            'success': True,
+            'decrypted_image': result['decrypted_image'],
+            'decrypted_filename': result['decrypted_filename'],
+            'stats': result['stats'],
+            'deduplicated': result.get('deduplicated', False)
+        })
+    elif result.get('overloaded'):
+        return overloaded_response(result)
+    else:
+        return jsonify({'error': result['error']}), 500
+
 @app.route('/decrypt', methods=['POST'])
 def decrypt_route():
     try:
+        if STREAMING_UPLOADS and request.mimetype == 'multipart/form-data':
+            return decrypt_streaming()
+
         if 'encrypted_file' not in request.files:
             return jsonify({'error': 'No encrypted file provided'}), 400
         
@@ -229,13 +484,13 @@ def decrypt_route():
         
         # Save uploaded encrypted file temporarily
         filename = secure_filename(file.filename)
-        temp_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(temp_path)
+        temp_path = os.path.join(staging_dir(), filename)
+        save_upload(file, temp_path)
         
-        # Check if meta file exists alongside the encrypted file
-        # The meta file should be uploaded together with the .enc file
+        # Integrity digests are embedded in the container header; a legacy .meta
+        # sidecar is still accepted for files encrypted before the header existed
         meta_filename = filename + '.meta'
-        meta_path = os.path.join(UPLOAD_FOLDER, meta_filename)
+        meta_path = os.path.join(os.path.dirname(temp_path), meta_filename)
         
         # Look for meta file in multiple ways:
         # 1. Separate meta_file upload field
@@ -252,30 +507,144 @@ def decrypt_route():
                     uploaded_file.save(meta_path)
                     break
         
-        # Decrypt the image
-        result = decrypt_image_web(temp_path, pin)
-        
-        # Clean up temporary files after decryption
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        if os.path.exists(meta_path):
-            os.remove(meta_path)
-        
-        if result['success']:
-            return jsonify({
-                'success': True,
-                'decrypted_image': result['decrypted_image'],
-                'decrypted_filename': result['decrypted_filename'],
-                'stats': result['stats']
-            })
-        else:
-            return jsonify({'error': result['error']}), 500
+        return decrypt_response(temp_path, pin, meta_path)
             
     except Exception as e:
         error_msg = f"Flask decryption error: {str(e)}"
         log_event(error_msg)
         return jsonify({'error': error_msg}), 500
 
+@app.route('/verify', methods=['POST'])
+def verify_route():
+    # Authenticates the ciphertext and compares digests without decoding or saving the image
+    if 'encrypted_file' not in request.files:
+        return jsonify({'error': 'No encrypted file provided'}), 400
+    pin = request.form.get('pin')
+    if not pin:
+        return jsonify({'error': 'PIN is required'}), 400
+
+    meta_hash = None
+    meta_file = request.files.get('meta_file')
+    if meta_file and meta_file.filename:
+        meta_hash = meta_file.read().decode('utf-8', 'replace').strip()
+    try:
+        result = verify_container(request.files['encrypted_file'].stream, pin, meta_hash=meta_hash)
+    except ContainerError as e:
+        return jsonify({'error': f"Invalid container: {e}"}), 400
+    log_event(f"Verification - authenticated: {result['authenticated']}, integrity: {result['integrity_verified']}")
+    return jsonify(result)
+
+@app.route('/rekey', methods=['POST'])
+def rekey_route():
+    # Re-encrypts the payload for a new PIN without decoding the image; returns the new container.
+    # Scrambled containers would need a full decrypt/encrypt outside the admission budget, so they
+    # are refused here (bulk_cli.py rekey handles them offline)
+    if 'encrypted_file' not in request.files:
+        return jsonify({'error': 'No encrypted file provided'}), 400
+    old_pin = request.form.get('old_pin')
+    new_pin = request.form.get('new_pin')
+    if not old_pin or not new_pin:
+        return jsonify({'error': 'old_pin and new_pin are required'}), 400
+
+    file = request.files['encrypted_file']
+    filename = secure_filename(file.filename) or 'image_encrypted.enc'
+    work_dir = tempfile.mkdtemp(dir=UPLOAD_FOLDER, prefix='.rekey-')
+    src_path = os.path.join(work_dir, 'source.enc')
+    dst_path = os.path.join(work_dir, filename)
+    try:
+        file.save(src_path)
+        with open(src_path, 'rb') as src:
+            if read_container_header(src).permutation_salt:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                return jsonify({'error': 'Scrambled containers cannot be re-keyed online: their pixel '
+                                         'permutation depends on the PIN. Decrypt and encrypt again instead.'}), 400
+            src.seek(0)
+            with open(dst_path, 'wb') as dst:
+                rekey_stream(src, dst, old_pin, new_pin)
+    except InvalidToken:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        log_event(f"Re-key failed (wrong PIN or corrupted file): {filename}")
+        return jsonify({'error': 'Wrong old PIN or corrupted file'}), 401
+    except (ContainerError, ValueError) as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({'error': f"Invalid container: {e}"}), 400
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    log_event(f"Re-keyed container: {filename}")
+    def stream_output():
+        # The temp directory goes away once the body is sent (or the client disconnects)
+        try:
+            with open(dst_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    yield block
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return Response(stream_output(), mimetype='application/octet-stream', headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'Content-Length': str(os.path.getsize(dst_path)),
+    })
+
+@app.route('/uploads', methods=['POST'])
+def init_upload():
+    data = request.get_json(silent=True) or {}
+    try:
+        filename = secure_filename(data.get('filename') or '')
+        purpose = data.get('purpose', 'encrypt')
+        if purpose == 'encrypt' and filename and not allowed_file(filename):
+            return jsonify({'error': 'Invalid file type. Only PNG, JPG, JPEG, GIF, TIFF allowed'}), 400
+        return jsonify(upload_store.init(filename, data.get('size'), purpose)), 201
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    try:
+        return jsonify(upload_store.status(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    try:
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({'error': 'offset query parameter is required'}), 400
+        # request.stream is read in small pieces, so the chunk is never held in memory
+        return jsonify(upload_store.append_chunk(upload_id, offset, request.stream, request.content_length,
+                                                 request.headers.get('X-Chunk-SHA256')))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    data = request.get_json(silent=True) or request.form
+    pin = data.get('pin')
+    hash_algo = data.get('hash_algo', DEFAULT_HASH_ALGO)
+    scramble = str(data.get('scramble', '')).lower() in ('1', 'true', 'yes', 'on')
+    # Request errors are answered before anything is assembled, and leave the upload as it is
+    if not pin:
+        return jsonify({'error': 'PIN is required'}), 400
+    if hash_algo not in HASH_ALGORITHMS:
+        return jsonify({'error': f"Unsupported hash_algo. Use one of: {', '.join(HASH_ALGORITHMS)}"}), 400
+
+    try:
+        with upload_store.finalizing(upload_id):
+            path, state = upload_store.finalize(upload_id, data.get('sha256'))
+            if state['purpose'] == 'decrypt':
+                response = app.make_response(decrypt_response(path, pin))
+            else:
+                response = app.make_response(encrypt_response(path, pin, hash_algo, scramble))
+            # Keep the upload for a retry (server busy, wrong PIN, ...); it expires with the
+            # other staged uploads. Done with it on success, or when it can never fit (413).
+            if response.status_code < 400 or response.status_code == 413:
+                upload_store.discard(upload_id)
+            return response
+    except UploadError as e:
+        return upload_error_response(e)
+
 @app.route('/download/<filename>')
 def download_file(filename):
     try:
@@ -306,6 +675,14 @@ def download_file(filename):
         print(traceback.format_exc(), file=sys.stderr, flush=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics')
+def metrics():
+    return jsonify({
+        'pid': os.getpid(),
+        'admission': admission_controller.snapshot(),
+        'content_store': content_store.snapshot() if content_store else None
+    })
+
 @app.route('/logs')
 def view_logs():
     return jsonify({'error': 'Use /get_logs endpoint with authentication'}), 401
@@ -327,20 +704,33 @@ def get_logs():
     if not session.get('authenticated'):
         return jsonify({'error': 'Not authenticated'}), 401
     
-    log_path = os.path.join("logs", "activity_log.csv")
-    if not os.path.exists(log_path):
-        return jsonify({'logs': []})
-    
-    logs = []
     try:
-        import csv
-        with open(log_path, "r") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                logs.append(row)
-        return jsonify({'logs': logs})
+        # Only the newest entries are returned here; /export_logs streams the full history
+        limit = request.args.get('limit', default=LOG_VIEW_LIMIT, type=int)
+        rows = get_log_store().read(limit=limit, event_type=request.args.get('type'),
+                                    since=request.args.get('since'))
+        return jsonify({'logs': [CSV_HEADER] + rows if rows else []})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/export_logs', methods=['GET'])
+def export_logs():
+    if not session.get('authenticated'):
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    rows = iter_export_rows(get_log_store(), event_type=request.args.get('type'),
+                            since=request.args.get('since'),
+                            include_archives=request.args.get('archives', '1') != '0')
+    if export_format == 'csv':
+        body, mimetype = export_csv(rows), 'text/csv'
+    else:
+        body, mimetype = export_ndjson(rows), 'application/x-ndjson'
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=activity_log.{export_format}'
+    })
+
 if __name__ == '__main__':
     app.run(debug=False, host='0.0.0.0', port=5500)
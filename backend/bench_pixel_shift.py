@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark the additive pixel shift against the keyed block permutation.
+
+    python bench_pixel_shift.py [--sizes 1 4 16 64] [--repeat 3]
+
+Sizes are in megapixels; each row reports the best-of-N time and throughput
+in MB/s of RGB pixel data, and checks that both transforms invert exactly.
+"""
+import argparse
+import os
+import time
+import numpy as np
+from pixel_shift import permute_pixels, reverse_shift_pixels, reverse_unshift_pixels, unpermute_pixels
+
+
+def best_of(repeat, func, *args):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 16, 64], help="Image sizes in megapixels")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    pin, salt = "benchmark-pin", os.urandom(16)
+    rng = np.random.default_rng(0)
+    print(f"{'MP':>4} {'shift':>10} {'unshift':>10} {'permute':>10} {'unpermute':>10}   (ms, MB/s)")
+    for megapixels in args.sizes:
+        side = int((megapixels * 1_000_000) ** 0.5)
+        pixels = rng.integers(0, 256, size=(side, side, 3), dtype=np.uint8)
+        mb = pixels.nbytes / (1024 * 1024)
+
+        t_shift, shifted = best_of(args.repeat, reverse_shift_pixels, pixels)
+        t_unshift, unshifted = best_of(args.repeat, reverse_unshift_pixels, shifted)
+        t_perm, permuted = best_of(args.repeat, permute_pixels, pixels, pin, salt)
+        t_unperm, unpermuted = best_of(args.repeat, unpermute_pixels, permuted, pin, salt)
+        assert np.array_equal(unshifted, pixels) and np.array_equal(unpermuted, pixels)
+
+        cells = [f"{t * 1000:6.0f}/{mb / t:<5.0f}" for t in (t_shift, t_unshift, t_perm, t_unperm)]
+        print(f"{megapixels:>4} " + " ".join(f"{cell:>10}" for cell in cells))
+        del pixels, shifted, unshifted, permuted, unpermuted
+
+
+if __name__ == '__main__':
+    main()
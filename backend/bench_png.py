@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark PNG encoding of decrypted output: Pillow against the strip encoder.
+
+    python bench_png.py [--sizes 1 4 12] [--levels 1 4 6 9] [--workers 4] [--image photo.jpg]
+
+Sizes are in megapixels. Without --image a synthetic photo-like image is used
+(smooth gradients plus sensor-style noise). Each row reports the best-of-N time,
+throughput in MB/s of raw pixel data and output size relative to Pillow level 6,
+and checks that the strip encoder's output decodes back to the same pixels.
+"""
+import argparse
+import io
+import numpy as np
+from PIL import Image
+from bench_pixel_shift import best_of
+from png_encode import ENCODE_WORKERS, encode_png
+
+
+def synthetic_photo(side, rng):
+    y, x = np.mgrid[0:side, 0:side].astype(np.float32) / side
+    base = np.stack([np.sin(6 * x + 2 * y), np.cos(4 * y - 3 * x), np.sin(5 * (x * y))], axis=-1)
+    noise = rng.normal(0, 0.02, size=(side, side, 3))
+    return ((base * 0.5 + 0.5 + noise).clip(0, 1) * 255).astype(np.uint8)
+
+
+def pillow_png(pixels, level):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG', compress_level=level)
+    return buffer.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 12], help="Image sizes in megapixels")
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 4, 6, 9])
+    parser.add_argument('--workers', type=int, default=ENCODE_WORKERS, help="Strip encoder threads")
+    parser.add_argument('--image', help="Resize this image instead of generating one")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    print(f"{'MP':>4} {'lvl':>3} {'pillow':>16} {'strips x1':>16} {'strips xN':>16}   (ms/MB/s/size%)")
+    for megapixels in args.sizes:
+        side = int((megapixels * 1_000_000) ** 0.5)
+        if args.image:
+            pixels = np.asarray(Image.open(args.image).convert('RGB').resize((side, side)))
+        else:
+            pixels = synthetic_photo(side, rng)
+        mb = pixels.nbytes / (1024 * 1024)
+        reference = len(pillow_png(pixels, 6))
+
+        for level in args.levels:
+            cells = []
+            for encode in (lambda: pillow_png(pixels, level),
+                           lambda: encode_png(pixels, level, workers=1),
+                           lambda: encode_png(pixels, level, workers=args.workers)):
+                seconds, data = best_of(args.repeat, encode)
+                cells.append(f"{seconds * 1000:.0f}/{mb / seconds:.0f}/{100 * len(data) / reference:.0f}")
+            assert np.array_equal(np.asarray(Image.open(io.BytesIO(data))), pixels)
+            print(f"{megapixels:>4} {level:>3} " + " ".join(f"{cell:>16}" for cell in cells))
+        del pixels
+
+
+if __name__ == '__main__':
+    main()
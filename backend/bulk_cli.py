@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Headless bulk encryption/decryption of whole directory trees.
+
+    python bulk_cli.py encrypt SRC_DIR DST_DIR [--include '*.jpg'] [--workers 8]
+    python bulk_cli.py decrypt SRC_DIR DST_DIR [--manifest run.jsonl]
+    python bulk_cli.py rekey SRC_DIR DST_DIR     # DST_DIR may equal SRC_DIR (in place)
+
+The PIN is read from $IMAGE_PIN (or --pin-env) or prompted for, never taken
+from argv; rekey also reads the new PIN from $IMAGE_NEW_PIN (--new-pin-env). Completed files are appended to a JSONL manifest so an interrupted
+run can be resumed by re-running the same command.
+"""
+import argparse
+import fnmatch
+import getpass
+import json
+import os
+import sys
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from container import DEFAULT_HASH_ALGO, HASH_ALGORITHMS
+from core import decrypt_file, encrypt_file
+from rekey import rekey_file
+
+DEFAULT_INCLUDES = {
+    'encrypt': ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.tif', '*.tiff'],
+    'decrypt': ['*.enc'],
+    'rekey': ['*.enc'],
+}
+MANIFEST_NAME = '.bulk_manifest.jsonl'
+
+# Per-worker state set once by the pool initializer (keeps the PIN out of every task)
+_worker_pin = None
+_worker_hash_algo = DEFAULT_HASH_ALGO
+_worker_scramble = False
+_worker_new_pin = None
+
+
+def _init_worker(pin, hash_algo, scramble=False, new_pin=None):
+    global _worker_pin, _worker_hash_algo, _worker_scramble, _worker_new_pin
+    _worker_pin = pin
+    _worker_hash_algo = hash_algo
+    _worker_scramble = scramble
+    _worker_new_pin = new_pin
+
+
+def output_path_for(mode, rel_path, dst_dir):
+    if mode == 'encrypt':
+        return os.path.join(dst_dir, rel_path + '.enc')
+    if mode == 'rekey':
+        return os.path.join(dst_dir, rel_path)
+    base = rel_path[:-4] if rel_path.endswith('.enc') else rel_path
+    base = os.path.splitext(base)[0]
+    if base.endswith('_encrypted'):
+        base = base[:-10]
+    return os.path.join(dst_dir, base + '.png')
+
+
+def _matches(rel_path, patterns):
+    name = os.path.basename(rel_path)
+    return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+def iter_files(src_dir, includes, excludes):
+    """Yield relative paths (with '/' separators) lazily, so huge trees are never listed in memory"""
+    for root, dirs, files in os.walk(src_dir):
+        dirs.sort()
+        for name in sorted(files):
+            rel_path = os.path.relpath(os.path.join(root, name), src_dir).replace(os.sep, '/')
+            if _matches(rel_path, includes) and not _matches(rel_path, excludes):
+                yield rel_path
+
+
+def load_manifest(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Torn last line from an interrupted run
+            if entry.get('status') == 'ok':
+                done.add(entry['path'])
+    return done
+
+
+def process_one(mode, src_path, dst_path):
+    """Runs in a worker process. Never raises; returns a manifest entry."""
+    started = time.perf_counter()
+    try:
+        if mode == 'encrypt':
+            encrypt_file(src_path, dst_path, _worker_pin, hash_algo=_worker_hash_algo, scramble=_worker_scramble)
+        elif mode == 'rekey':
+            rekey_file(src_path, dst_path, _worker_pin, _worker_new_pin)
+        else:
+            # Multi-page TIFF containers decrypt to .tif, so use the path actually written
+            dst_path = decrypt_file(src_path, dst_path, _worker_pin)['output_path']
+        return {
+            'status': 'ok',
+            'bytes_in': os.path.getsize(src_path),
+            'bytes_out': os.path.getsize(dst_path),
+            'seconds': round(time.perf_counter() - started, 4),
+        }
+    except Exception as e:
+        return {
+            'status': 'error',
+            'error': f"{type(e).__name__}: {e}",
+            'seconds': round(time.perf_counter() - started, 4),
+        }
+
+
+def run(mode, src_dir, dst_dir, pin, includes=None, excludes=(), workers=None,
+        manifest_path=None, hash_algo=DEFAULT_HASH_ALGO, scramble=False, new_pin=None, out=sys.stdout):
+    """Process a directory tree and return the throughput summary"""
+    includes = includes or DEFAULT_INCLUDES[mode]
+    workers = workers or os.cpu_count() or 1
+    manifest_path = manifest_path or os.path.join(dst_dir, MANIFEST_NAME)
+    os.makedirs(dst_dir, exist_ok=True)
+
+    done = load_manifest(manifest_path)
+    summary = {'processed': 0, 'failed': 0, 'skipped': 0, 'bytes_in': 0, 'bytes_out': 0}
+    started = time.perf_counter()
+    # Bounded in-flight window keeps memory flat regardless of tree size
+    max_in_flight = workers * 4
+
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(pin, hash_algo, scramble, new_pin))
+
+    pool = new_pool()
+    try:
+        with open(manifest_path, "a") as manifest:
+            pending = {}
+
+            def record(rel_path, entry):
+                entry['path'] = rel_path
+                manifest.write(json.dumps(entry) + "\n")
+                manifest.flush()
+                if entry['status'] == 'ok':
+                    summary['processed'] += 1
+                    summary['bytes_in'] += entry['bytes_in']
+                    summary['bytes_out'] += entry['bytes_out']
+                else:
+                    summary['failed'] += 1
+                    print(f"❌ {rel_path}: {entry['error']}", file=sys.stderr, flush=True)
+                total = summary['processed'] + summary['failed']
+                if total and total % 1000 == 0:
+                    print(f"… {total} files done", file=out, flush=True)
+
+            def restart_pool():
+                # A worker died (e.g. OOM-killed): everything in flight fails with it and is
+                # retried by the next run; carry on with a fresh pool
+                nonlocal pool
+                print("⚠️ Worker process died, restarting the pool", file=sys.stderr, flush=True)
+                drain(ALL_COMPLETED, restart=False)
+                pool.shutdown(wait=False)
+                pool = new_pool()
+
+            def drain(return_when, restart=True):
+                finished, _ = wait(pending, return_when=return_when)
+                broken = False
+                for future in finished:
+                    try:
+                        entry = future.result()
+                    except BrokenProcessPool as e:
+                        broken = True
+                        entry = {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+                    record(pending.pop(future), entry)
+                if broken and restart:
+                    restart_pool()
+
+            def submit(src_path, dst_path):
+                try:
+                    return pool.submit(process_one, mode, src_path, dst_path)
+                except BrokenProcessPool:
+                    restart_pool()
+                    return pool.submit(process_one, mode, src_path, dst_path)
+
+            # Outputs drop the container extension, so a.jpg.enc and a.png.enc would both
+            # write a.png; outputs are claimed per directory (the walk visits one at a time)
+            claimed, claimed_dir = {}, None
+            for rel_path in iter_files(src_dir, includes, excludes):
+                dst_path = output_path_for(mode, rel_path, dst_dir)
+                if os.path.dirname(rel_path) != claimed_dir:
+                    claimed, claimed_dir = {}, os.path.dirname(rel_path)
+                owner = claimed.setdefault(dst_path, rel_path)
+                if rel_path in done:
+                    summary['skipped'] += 1
+                    continue
+                if owner != rel_path:
+                    record(rel_path, {'status': 'error',
+                                      'error': f"Output {os.path.basename(dst_path)} would overwrite the one for {owner}"})
+                    continue
+                src_path = os.path.join(src_dir, rel_path)
+                pending[submit(src_path, dst_path)] = rel_path
+                if len(pending) >= max_in_flight:
+                    drain(FIRST_COMPLETED)
+            while pending:
+                drain(FIRST_COMPLETED)
+    finally:
+        pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    summary['seconds'] = round(elapsed, 3)
+    summary['files_per_sec'] = round(summary['processed'] / elapsed, 2) if elapsed else 0.0
+    summary['mb_per_sec'] = round(summary['bytes_in'] / (1024 * 1024) / elapsed, 2) if elapsed else 0.0
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk encrypt/decrypt image directory trees")
+    parser.add_argument('mode', choices=['encrypt', 'decrypt', 'rekey'])
+    parser.add_argument('src', help="Source directory")
+    parser.add_argument('dst', help="Destination directory (mirrors the source tree)")
+    parser.add_argument('--include', action='append', help="Glob to include (repeatable)")
+    parser.add_argument('--exclude', action='append', default=[], help="Glob to exclude (repeatable)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--manifest', default=None, help=f"Progress manifest (default: DST/{MANIFEST_NAME})")
+    parser.add_argument('--hash-algo', default=DEFAULT_HASH_ALGO, choices=sorted(HASH_ALGORITHMS))
+    parser.add_argument('--scramble', action='store_true', help="Also apply the PIN-seeded pixel permutation")
+    parser.add_argument('--pin-env', default='IMAGE_PIN', help="Environment variable holding the PIN")
+    parser.add_argument('--new-pin-env', default='IMAGE_NEW_PIN', help="Environment variable holding the new PIN (rekey)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.src):
+        parser.error(f"Source directory not found: {args.src}")
+
+    pin = os.getenv(args.pin_env) or getpass.getpass("PIN: ")
+    if not pin:
+        parser.error("PIN is required")
+    new_pin = None
+    if args.mode == 'rekey':
+        new_pin = os.getenv(args.new_pin_env) or getpass.getpass("New PIN: ")
+        if not new_pin:
+            parser.error("New PIN is required")
+
+    summary = run(args.mode, args.src, args.dst, pin, includes=args.include, excludes=args.exclude,
+                  workers=args.workers, manifest_path=args.manifest, hash_algo=args.hash_algo,
+                  scramble=args.scramble, new_pin=new_pin)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+Resumable chunked uploads.
+
+    POST /uploads                  {"filename", "size", "purpose": "encrypt"|"decrypt"} -> upload_id
+    GET  /uploads/<id>             -> {"offset": bytes received so far}
+    PUT  /uploads/<id>?offset=N    raw chunk body, X-Chunk-SHA256 header
+    POST /uploads/<id>/finalize    {"pin", ...} -> same response as /encrypt or /decrypt
+
+Chunks are streamed straight into a staging file. Upload state lives on disk next
+to it, so any gunicorn worker can serve any request of the same upload, and a
+client that lost its connection asks for the offset and continues from there.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from werkzeug.exceptions import ClientDisconnected
+
+CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_MB', '4')) * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv('UPLOAD_MAX_MB', '256')) * 1024 * 1024
+UPLOAD_EXPIRY_SECONDS = int(os.getenv('UPLOAD_EXPIRY_HOURS', '24')) * 3600
+PURPOSES = ('encrypt', 'decrypt')
+COPY_BUFFER_BYTES = 64 * 1024
+
+
+class UploadError(ValueError):
+    """Client error; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUploadStore:
+    def __init__(self, staging_dir):
+        self.staging_dir = staging_dir
+        os.makedirs(staging_dir, exist_ok=True)
+
+    def _dir(self, upload_id):
+        # upload ids are uuid4 hex; anything else could escape the staging directory
+        if len(upload_id) != 32 or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError("Unknown upload", 404)
+        path = os.path.join(self.staging_dir, upload_id)
+        if not os.path.isdir(path):
+            raise UploadError("Unknown upload", 404)
+        return path
+
+    def _state(self, upload_id):
+        with open(os.path.join(self._dir(upload_id), 'state.json')) as f:
+            return json.load(f)
+
+    def _part_path(self, upload_id):
+        return os.path.join(self._dir(upload_id), 'data.part')
+
+    def init(self, filename, size, purpose):
+        if purpose not in PURPOSES:
+            raise UploadError(f"purpose must be one of: {', '.join(PURPOSES)}")
+        if not filename:
+            raise UploadError("filename is required")
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("size must be a positive integer")
+        if size > MAX_UPLOAD_BYTES:
+            raise UploadError(f"File too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)", 413)
+        self.purge_expired()
+
+        upload_id = uuid.uuid4().hex
+        upload_dir = os.path.join(self.staging_dir, upload_id)
+        os.makedirs(upload_dir)
+        open(os.path.join(upload_dir, 'data.part'), 'wb').close()
+        with open(os.path.join(upload_dir, 'state.json'), 'w') as f:
+            json.dump({'filename': filename, 'size': size, 'purpose': purpose, 'created': time.time()}, f)
+        return {'upload_id': upload_id, 'offset': 0, 'size': size, 'chunk_size': CHUNK_SIZE}
+
+    def status(self, upload_id):
+        state = self._state(upload_id)
+        return {'upload_id': upload_id, 'offset': os.path.getsize(self._part_path(upload_id)),
+                'size': state['size'], 'purpose': state['purpose']}
+
+    def append_chunk(self, upload_id, offset, stream, length, checksum):
+        """
+        Append `length` bytes read from stream at `offset`. The staging file size is the
+        committed offset: a chunk that fails its SHA-256 check is truncated away again.
+        """
+        state = self._state(upload_id)
+        if not checksum:
+            raise UploadError("X-Chunk-SHA256 header is required")
+        if length is None or length <= 0 or length > CHUNK_SIZE:
+            raise UploadError(f"Chunk length must be between 1 and {CHUNK_SIZE} bytes")
+
+        with open(self._part_path(upload_id), 'r+b') as part:
+            # Serialise appends to one upload across threads and worker processes
+            fcntl.flock(part, fcntl.LOCK_EX)
+            current = os.fstat(part.fileno()).st_size
+            if offset != current:
+                raise UploadError(f"Expected offset {current}", 409, offset=current)
+            if offset + length > state['size']:
+                raise UploadError("Chunk runs past the declared size", 416, offset=current)
+
+            part.seek(offset)
+            hasher = hashlib.sha256()
+            remaining = length
+            try:
+                while remaining:
+                    data = stream.read(min(remaining, COPY_BUFFER_BYTES))
+                    if not data:
+                        break
+                    hasher.update(data)
+                    part.write(data)
+                    remaining -= len(data)
+            except ClientDisconnected:
+                pass  # Body shorter than Content-Length: reported as truncated below
+            except BaseException:
+                part.truncate(offset)
+                raise
+
+            if remaining or hasher.hexdigest() != checksum.lower():
+                part.truncate(offset)
+                message = "Chunk truncated" if remaining else "Chunk checksum mismatch"
+                raise UploadError(message, 422, offset=offset)
+            part.flush()
+            os.fsync(part.fileno())
+            return {'upload_id': upload_id, 'offset': offset + length, 'size': state['size']}
+
+    @contextmanager
+    def finalizing(self, upload_id):
+        """Hold an upload for one finalize at a time, across workers; a concurrent finalize gets 409"""
+        with open(os.path.join(self._dir(upload_id), 'finalize.lock'), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError("Upload is already being finalized", 409)
+            yield
+
+    def finalize(self, upload_id, sha256=None):
+        """
+        Check the upload is complete (and matches sha256 if given) and return
+        (path of the assembled file named after the original filename, state).
+        The received data stays staged, so a failed attempt can be finalized
+        again; the caller removes the upload with discard() once it is done with it.
+        """
+        state = self._state(upload_id)
+        part_path = self._part_path(upload_id)
+        received = os.path.getsize(part_path)
+        if received != state['size']:
+            raise UploadError(f"Upload incomplete: {received} of {state['size']} bytes", 409, offset=received)
+
+        if sha256:
+            hasher = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.update(block)
+            if hasher.hexdigest() != sha256.lower():
+                raise UploadError("File checksum mismatch", 422)
+
+        # Outputs are named after the input's basename, so give the file its real name
+        # (a link in its own directory, which cannot clash with state.json or data.part)
+        input_dir = os.path.join(self._dir(upload_id), 'input')
+        os.makedirs(input_dir, exist_ok=True)
+        final_path = os.path.join(input_dir, state['filename'])
+        if os.path.exists(final_path):
+            os.remove(final_path)
+        try:
+            os.link(part_path, final_path)
+        except OSError:
+            shutil.copyfile(part_path, final_path)
+        return final_path, state
+
+    def discard(self, upload_id):
+        shutil.rmtree(os.path.join(self.staging_dir, upload_id), ignore_errors=True)
+
+    def purge_expired(self, max_age=UPLOAD_EXPIRY_SECONDS):
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.staging_dir):
+            path = os.path.join(self.staging_dir, name)
+            part_path = os.path.join(path, 'data.part')
+            try:
+                # Appends touch data.part, not the directory, so an active upload stays fresh
+                last_activity = max(os.path.getmtime(path),
+                                    os.path.getmtime(part_path) if os.path.exists(part_path) else 0)
+                if last_activity < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
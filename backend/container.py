@@ -0,0 +1,218 @@
+import hashlib
+import io
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+# Encrypted container layout:
+#   MAGIC (4) | VERSION (1) | HASH_ID (1) | DIGEST_LEN (1) | DIGEST | [v2 options] | FERNET TOKEN
+# Version 2 adds FLAGS (1) | SALT_LEN (1) | SALT after the digest, for keyed pixel permutation
+# and multi-frame containers (the token is then a stream of length-prefixed chunks, see frames.py).
+# Files without the magic prefix are legacy raw Fernet tokens (optionally with a .meta sidecar).
+MAGIC = b'SIMG'
+VERSION = 1
+VERSION_WITH_OPTIONS = 2
+HEADER_FIXED_SIZE = len(MAGIC) + 3
+FLAG_PERMUTED = 0x01
+FLAG_MULTI_FRAME = 0x02
+PERMUTATION_SALT_BYTES = 16
+# Upper bound on header size: fixed part, digest and options with a maximal salt
+MAX_HEADER_BYTES = HEADER_FIXED_SIZE + 255 + 2 + 255
+
+ContainerHeader = namedtuple('ContainerHeader', ['hash_algo', 'digest', 'permutation_salt', 'multi_frame'])
+LEGACY_HEADER = ContainerHeader(None, None, None, False)
+
+HASH_ALGORITHMS = {
+    'sha256': 1,
+    'blake2b': 2,
+}
+HASH_NAMES = {hash_id: name for name, hash_id in HASH_ALGORITHMS.items()}
+DEFAULT_HASH_ALGO = os.getenv('INTEGRITY_HASH', 'sha256').strip().lower()
+if DEFAULT_HASH_ALGO not in HASH_ALGORITHMS:
+    # Fail at startup rather than on every request that relies on the default
+    raise ValueError(f"INTEGRITY_HASH must be one of: {', '.join(sorted(HASH_ALGORITHMS))} (got {DEFAULT_HASH_ALGO!r})")
+
+
+class ContainerError(ValueError):
+    pass
+
+
+def new_hasher(algo=DEFAULT_HASH_ALGO):
+    if algo not in HASH_ALGORITHMS:
+        raise ContainerError(f"Unsupported hash algorithm: {algo}")
+    if algo == 'blake2b':
+        return hashlib.blake2b(digest_size=32)
+    return hashlib.new(algo)
+
+
+class HashingWriter(io.RawIOBase):
+    """File-like writer that hashes bytes as they are produced (e.g. by Image.save)"""
+
+    def __init__(self, fp, hasher):
+        self.fp = fp
+        self.hasher = hasher
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.hasher.update(data)
+        return self.fp.write(data)
+
+    def flush(self):
+        self.fp.flush()
+
+
+class HashingReader(io.RawIOBase):
+    """
+    File-like reader that hashes bytes as a consumer (e.g. Pillow) reads them.
+    Seeks are allowed; only bytes past the hashed high-water mark are hashed,
+    and any gap skipped by a forward seek is filled in so the digest stays exact.
+    """
+
+    def __init__(self, fp, hashers):
+        self.fp = fp
+        self.hashers = list(hashers)
+        self._hashed = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.fp.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.fp.seek(offset, whence)
+
+    def _update(self, data):
+        for hasher in self.hashers:
+            hasher.update(data)
+
+    def _catch_up(self, position):
+        # Hash any bytes between the high-water mark and `position` that were skipped by a seek
+        if position <= self._hashed:
+            return
+        current = self.fp.tell()
+        self.fp.seek(self._hashed)
+        remaining = position - self._hashed
+        while remaining > 0:
+            chunk = self.fp.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            self._update(chunk)
+            remaining -= len(chunk)
+        self._hashed = position
+        self.fp.seek(current)
+
+    def read(self, size=-1):
+        start = self.fp.tell()
+        self._catch_up(start)
+        data = self.fp.read(size)
+        end = start + len(data)
+        if end > self._hashed:
+            self._update(data[self._hashed - start:])
+            self._hashed = end
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def finish(self):
+        """Hash whatever the consumer did not read and return the hex digests"""
+        self.fp.seek(0, io.SEEK_END)
+        self._catch_up(self.fp.tell())
+        return [hasher.hexdigest() for hasher in self.hashers]
+
+
+def build_header(algo, hex_digest, permutation_salt=None, multi_frame=False):
+    digest = bytes.fromhex(hex_digest)
+    flags = (FLAG_PERMUTED if permutation_salt else 0) | (FLAG_MULTI_FRAME if multi_frame else 0)
+    version = VERSION_WITH_OPTIONS if flags else VERSION
+    header = MAGIC + bytes([version, HASH_ALGORITHMS[algo], len(digest)]) + digest
+    if flags:
+        salt = permutation_salt or b''
+        header += bytes([flags, len(salt)]) + salt
+    return header
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    Open a temp file next to path for writing ("w+b") and rename it over path on success.
+    Readers never see partial output, and a path that is a hard link into the content
+    store is replaced rather than overwritten in place.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.part-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, "w+b") as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_container(path, algo, hex_digest, token, permutation_salt=None):
+    with atomic_output(path) as f:
+        f.write(build_header(algo, hex_digest, permutation_salt))
+        f.write(token)
+
+
+def parse_container(data):
+    """
+    Split container bytes into (ContainerHeader, fernet_token).
+    Legacy files without a header return (LEGACY_HEADER, data).
+    """
+    if not data.startswith(MAGIC):
+        return LEGACY_HEADER, data
+    if len(data) < HEADER_FIXED_SIZE:
+        raise ContainerError("Truncated container header")
+    version, hash_id, digest_len = data[len(MAGIC):HEADER_FIXED_SIZE]
+    if version not in (VERSION, VERSION_WITH_OPTIONS):
+        raise ContainerError(f"Unsupported container version: {version}")
+    if hash_id not in HASH_NAMES:
+        raise ContainerError(f"Unknown hash id in container header: {hash_id}")
+    offset = HEADER_FIXED_SIZE + digest_len
+    if len(data) < offset:
+        raise ContainerError("Truncated container digest")
+    hex_digest = bytes(data[HEADER_FIXED_SIZE:offset]).hex()
+
+    permutation_salt = None
+    flags = 0
+    if version == VERSION_WITH_OPTIONS:
+        if len(data) < offset + 2:
+            raise ContainerError("Truncated container options")
+        flags, salt_len = data[offset:offset + 2]
+        salt = bytes(data[offset + 2:offset + 2 + salt_len])
+        if len(salt) != salt_len:
+            raise ContainerError("Truncated permutation salt")
+        offset += 2 + salt_len
+        if flags & FLAG_PERMUTED:
+            permutation_salt = salt
+    multi_frame = bool(flags & FLAG_MULTI_FRAME)
+    return ContainerHeader(HASH_NAMES[hash_id], hex_digest, permutation_salt, multi_frame), data[offset:]
+
+
+def read_container_header(fp):
+    """Parse the header from an open file and leave fp positioned at the first token byte"""
+    start = fp.tell()
+    prefix = fp.read(MAX_HEADER_BYTES)
+    header, rest = parse_container(prefix)
+    fp.seek(start + len(prefix) - len(rest))
+    return header
+
+
+def read_legacy_meta(path):
+    """Return the SHA-256 hex digest from a legacy .meta sidecar, or None"""
+    meta_path = path + ".meta"
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as meta_file:
+        return meta_file.read().strip()
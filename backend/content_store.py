@@ -0,0 +1,177 @@
+"""
+Content-addressed store for encrypt/decrypt outputs.
+
+An entry is keyed by HMAC-SHA256 over the operation, its parameters and the
+SHA-256 of the input, with a store-only key derived from the PIN's Fernet key
+(so the encryption key itself is never used as a MAC key). A retried or
+duplicate submission maps to the same entry and is answered without
+reprocessing. Different PINs never share an entry, and a key reveals nothing
+without the PIN. Layout under the store root:
+
+    objects/ab/cd/<key>        output file (two levels of fan-out)
+    objects/ab/cd/<key>.json   response metadata (stats, output suffix)
+    locks/ab.lock              striped locks, held while an entry is computed
+
+Output names in uploads/ are hard links to the object, so the link count is the
+reference count. A name that is reused drops its old reference.
+purge_unreferenced() removes objects that no name points at any more.
+"""
+import fcntl
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from key_utils import generate_key_from_pin
+
+UNREFERENCED_GRACE_SECONDS = int(os.getenv('CONTENT_STORE_GRACE_MINUTES', '60')) * 60
+PURGE_INTERVAL_SECONDS = 600
+HASH_BUFFER_BYTES = 1024 * 1024
+KEY_LABEL = b'secure-image-app content-store v1'
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BUFFER_BYTES), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class ContentStore:
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.locks_dir = os.path.join(root, 'locks')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.locks_dir, exist_ok=True)
+        self._counts_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._last_purge = 0.0
+
+    @staticmethod
+    def key_for(operation, input_digest, pin, **params):
+        """Entry key for an operation on an input (by its SHA-256) with a PIN and parameters"""
+        message = json.dumps([operation, input_digest, sorted(params.items())], separators=(',', ':'))
+        store_key = hmac.new(generate_key_from_pin(pin), KEY_LABEL, hashlib.sha256).digest()
+        return hmac.new(store_key, message.encode(), hashlib.sha256).hexdigest()
+
+    def _object_path(self, key):
+        return os.path.join(self.objects_dir, key[:2], key[2:4], key)
+
+    @contextmanager
+    def lock(self, key, blocking=True):
+        """
+        Serialise work on one key across threads and processes, so concurrent retries
+        compute once. Yields False if blocking=False and the lock is busy.
+        """
+        with open(os.path.join(self.locks_dir, key[:2] + '.lock'), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def lookup(self, key):
+        """Stored metadata (with 'path') for key, or None"""
+        path = self._object_path(key)
+        try:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if meta is None or not os.path.exists(path):
+            with self._counts_lock:
+                self.misses += 1
+            return None
+        with self._counts_lock:
+            self.hits += 1
+        meta['path'] = path
+        return meta
+
+    def put(self, key, output_path, meta):
+        """Adopt output_path (left in place, as the first reference) as the object for key; returns the object's path"""
+        path = self._object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Metadata first: an object without metadata is invisible, not half-described
+        tmp_meta = f"{path}.json.part-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_meta, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, path + '.json')
+        self._link_or_copy(output_path, path)
+        self._maybe_purge()
+        return path
+
+    def link(self, key, name_path):
+        """Point name_path at the object for key (adding a reference). False if it has gone."""
+        try:
+            self._link_or_copy(self._object_path(key), name_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _link_or_copy(src, dst):
+        tmp = f"{dst}.link-{os.getpid()}-{threading.get_ident()}"
+        try:
+            try:
+                os.link(src, tmp)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                # No hard links on this filesystem: the CPU work is still saved, the disk is not
+                shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def refcount(self, key):
+        """Number of names referencing the object (0 if it is only held by the store)"""
+        try:
+            return os.stat(self._object_path(key)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def purge_unreferenced(self, grace=UNREFERENCED_GRACE_SECONDS):
+        """Remove objects no name has referenced for `grace` seconds. Returns bytes freed."""
+        cutoff = time.time() - grace
+        freed = 0
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for name in filenames:
+                if name.endswith('.json') or '.part-' in name or '.link-' in name:
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                    # ctime changes when a link is added or removed, so it dates the last reference change
+                    if stat.st_nlink > 1 or stat.st_ctime > cutoff:
+                        continue
+                    # Non-blocking: the caller may already hold this stripe (put runs under lock)
+                    with self.lock(name, blocking=False) as locked:
+                        if not locked or os.stat(path).st_nlink > 1:
+                            continue
+                        os.remove(path + '.json')
+                        os.remove(path)
+                    freed += stat.st_size
+                except FileNotFoundError:
+                    continue
+        return freed
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge >= PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            self.purge_unreferenced()
+
+    def snapshot(self):
+        with self._counts_lock:
+            return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,157 @@
+"""
+Headless encryption/decryption pipeline shared by the desktop GUI and the bulk CLI.
+Nothing in here touches Tk, matplotlib or the activity log; errors are raised.
+"""
+import io
+import os
+from cryptography.fernet import Fernet
+from PIL import Image
+from pixel_shift import permute_pixels, unpermute_pixels
+from key_utils import generate_key_from_pin
+from entropy_stats import ciphertext_entropy, entropy_fields, get_stats_mode, shift_with_entropy, unshift_with_entropy
+from container import (DEFAULT_HASH_ALGO, PERMUTATION_SALT_BYTES, ContainerError, HashingReader, HashingWriter,
+                       atomic_output, build_header, new_hasher, parse_container, read_container_header, read_legacy_meta)
+from frames import decrypt_frames, encrypt_frames, is_multi_frame
+from png_encode import encode_png
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _stage(progress, cancel_event, name, fraction):
+    # Stage boundaries are the cancellation points; progress is (stage name, 0..1)
+    if cancel_event is not None and cancel_event.is_set():
+        raise Cancelled(name)
+    if progress is not None:
+        progress(name, fraction)
+
+
+def encrypt_image(image_path, pin, hash_algo=DEFAULT_HASH_ALGO, with_stats=True, scramble=False,
+                  progress=None, cancel_event=None, stats_mode=None):
+    """
+    Encrypt an image file. Returns (container_bytes, stats)
+    scramble=True adds a PIN-seeded block permutation of pixel positions after the shift.
+    Entropy is computed per stats_mode (default: STATS_MODE); with_stats=False skips it.
+    progress(stage, fraction) is called at each stage; setting cancel_event raises Cancelled.
+    """
+    _stage(progress, cancel_event, "Decoding image", 0.0)
+    image = Image.open(image_path).convert('RGB')
+
+    _stage(progress, cancel_event, "Shifting pixels", 0.3)
+    # In exact mode this is one fused pass: shift plus before/after grayscale histograms
+    shifted_img, entropy = shift_with_entropy(image, get_stats_mode(stats_mode) if with_stats else 'off')
+
+    permutation_salt = None
+    if scramble:
+        # Permuting positions leaves the histogram (and so entropy_after) unchanged
+        _stage(progress, cancel_event, "Scrambling pixels", 0.5)
+        permutation_salt = os.urandom(PERMUTATION_SALT_BYTES)
+        shifted_img = permute_pixels(shifted_img, pin, permutation_salt)
+
+    _stage(progress, cancel_event, "Encoding PNG", 0.6)
+    buffer = io.BytesIO()
+    hasher = new_hasher(hash_algo)
+    Image.fromarray(shifted_img).save(HashingWriter(buffer, hasher), format='PNG')
+    original_hash = hasher.hexdigest()
+
+    _stage(progress, cancel_event, "Encrypting", 0.9)
+    token = Fernet(generate_key_from_pin(pin)).encrypt(buffer.getvalue())
+    _stage(progress, None, "Done", 1.0)
+    return build_header(hash_algo, original_hash, permutation_salt) + token, {
+        **entropy,
+        'original_hash': original_hash,
+        'hash_algo': hash_algo,
+        'scrambled': scramble,
+    }
+
+
+def decrypt_image(encrypted_data, pin, meta_hash=None, with_stats=True, progress=None, cancel_event=None,
+                  stats_mode=None):
+    """
+    Decrypt container bytes. Returns (unshifted pixel array, stats).
+    stats['integrity_verified'] is None when there is nothing to check against,
+    False on a digest mismatch. Raises cryptography.fernet.InvalidToken on a wrong PIN,
+    and ContainerError for a multi-frame container (those go through decrypt_file()).
+    """
+    _stage(progress, cancel_event, "Decrypting", 0.0)
+    header, token = parse_container(encrypted_data)
+    if header.multi_frame:
+        raise ContainerError("Multi-frame container: decrypt it to an APNG/TIFF file instead")
+    decrypted_data = Fernet(generate_key_from_pin(pin)).decrypt(token)
+    stats_mode = get_stats_mode(stats_mode) if with_stats else 'off'
+
+    expected = []
+    if header.digest:
+        expected.append((header.hash_algo, header.digest))
+    if meta_hash:
+        expected.append((header.hash_algo or 'sha256', meta_hash))
+
+    _stage(progress, cancel_event, "Decoding PNG", 0.3)
+    reader = HashingReader(io.BytesIO(decrypted_data), [new_hasher(algo) for algo, _ in expected])
+    img = Image.open(reader).convert('RGB')
+    decrypted_hashes = reader.finish()
+
+    integrity_verified = None
+    if expected:
+        integrity_verified = all(expected_hash == decrypted_hash
+                                 for (_, expected_hash), decrypted_hash in zip(expected, decrypted_hashes))
+
+    if with_stats:
+        _stage(progress, cancel_event, "Measuring ciphertext entropy", 0.6)
+    entropy_before = ciphertext_entropy(token, stats_mode)
+    if header.permutation_salt:
+        # Unscrambling leaves the histogram (and so entropy_after) unchanged
+        _stage(progress, cancel_event, "Unscrambling pixels", 0.7)
+        img = unpermute_pixels(img, pin, header.permutation_salt)
+    _stage(progress, cancel_event, "Unshifting pixels", 0.75)
+    unshifted_img, entropy_after = unshift_with_entropy(img, stats_mode)
+    _stage(progress, None, "Done", 1.0)
+    return unshifted_img, {
+        **entropy_fields(stats_mode, entropy_before, entropy_after),
+        'decrypted_hashes': dict(zip([algo for algo, _ in expected], decrypted_hashes)),
+        'integrity_verified': integrity_verified,
+    }
+
+
+def _write_atomic(path, write):
+    # Write to a temp file then rename, so interrupted runs never leave partial outputs
+    with atomic_output(path) as f:
+        write(f)
+
+
+def encrypt_file(image_path, output_path, pin, hash_algo=DEFAULT_HASH_ALGO, with_stats=False, scramble=False):
+    with Image.open(image_path) as image:
+        if is_multi_frame(image):
+            # Animated / multi-page inputs stream one frame at a time into a chunked container
+            # (written atomically by encrypt_frames)
+            return encrypt_frames(image, pin, output_path, hash_algo=hash_algo, scramble=scramble,
+                                  stats_mode=None if with_stats else 'off')
+    container, stats = encrypt_image(image_path, pin, hash_algo=hash_algo, with_stats=with_stats, scramble=scramble)
+    _write_atomic(output_path, lambda f: f.write(container))
+    return stats
+
+
+def decrypt_file(encrypted_path, output_path, pin, with_stats=False):
+    """
+    Decrypt to a PNG file (APNG or multi-page TIFF for multi-frame containers, in
+    which case the extension may change; the path written is in stats['output_path']).
+    Raises ValueError if the integrity check fails.
+    """
+    with open(encrypted_path, "rb") as f:
+        header = read_container_header(f)
+        if header.multi_frame:
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            written_path, stats = decrypt_frames(f, header, pin, os.path.splitext(output_path)[0],
+                                                 stats_mode=None if with_stats else 'off')
+            stats['output_path'] = written_path
+            return stats
+        f.seek(0)
+        encrypted_data = f.read()
+    meta_hash = read_legacy_meta(encrypted_path)
+    unshifted_img, stats = decrypt_image(encrypted_data, pin, meta_hash=meta_hash, with_stats=with_stats)
+    if stats['integrity_verified'] is False:
+        raise ValueError("Hash mismatch detected! File may be tampered with.")
+    _write_atomic(output_path, lambda f: f.write(encode_png(unshifted_img)))
+    stats['output_path'] = output_path
+    return stats
@@ -1,100 +1,105 @@
-from cryptography.fernet import Fernet
-from PIL import Image, UnidentifiedImageError
-import io, os
-from tkinter import filedialog, messagebox
-import matplotlib.pyplot as plt
-from pixel_shift import reverse_unshift_pixels
-from key_utils import generate_key_from_pin, get_file_hash, get_file_size_kb, log_event, calculate_entropy
-
-def decrypt_image(encrypted_file_path, pin):
-    if not encrypted_file_path:
-        messagebox.showwarning("Warning", "No encrypted file selected!")
-        return
-    if not pin:
-        messagebox.showwarning("Warning", "Enter the correct PIN to decrypt!")
-        return
-
-    key = generate_key_from_pin(pin)
-    fernet = Fernet(key)
-
+import os
+import tkinter as tk
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from core import decrypt_image as decrypt_image_data
+from frames import decrypt_frames
+from png_encode import encode_png
+from container import read_container_header, read_legacy_meta
+from key_utils import get_file_size_kb, log_event
+
+def decrypt_image(encrypted_file_path, pin, output_dir, progress=None, cancel_event=None):
+    """
+    Decrypt one .enc file into output_dir and return its stats.
+    Runs on the GUI's background worker, so no Tk calls in here.
+    """
     try:
-        with open(encrypted_file_path, "rb") as f:
-            encrypted_data = f.read()
+        base_name = os.path.splitext(os.path.basename(encrypted_file_path))[0]
+        if base_name.endswith('_encrypted'):
+            base_name = base_name[:-10]
+        save_path = os.path.join(output_dir, f"{base_name}_decrypted.png")
 
         # Get encrypted file size BEFORE deleting it
         size_before = get_file_size_kb(encrypted_file_path)
+        meta_path = encrypted_file_path + ".meta"
 
-        decrypted_data = fernet.decrypt(encrypted_data)
-        decrypted_hash = get_file_hash(decrypted_data)
+        with open(encrypted_file_path, "rb") as f:
+            header = read_container_header(f)
+            if header.multi_frame:
+                # Animated / multi-page containers stream frame by frame into an APNG or TIFF
+                if progress is not None:
+                    progress("Decrypting frames", 0.0)
+                save_path, stats = decrypt_frames(f, header, pin, os.path.splitext(save_path)[0], stats_mode='exact')
+            else:
+                f.seek(0)
+                encrypted_data = f.read()
+
+        if not header.multi_frame:
+            unshifted_img, stats = decrypt_image_data(encrypted_data, pin,
+                                                      meta_hash=read_legacy_meta(encrypted_file_path),
+                                                      progress=progress, cancel_event=cancel_event, stats_mode='exact')
+            with open(save_path, 'wb') as f:
+                f.write(encode_png(unshifted_img))
         log_event(f"Encrypted file loaded: {encrypted_file_path}")
-        log_event(f"Post-decryption SHA256: {decrypted_hash}")
+        for algo, decrypted_hash in stats.get('decrypted_hashes', {}).items():
+            log_event(f"Post-decryption {algo.upper()}: {decrypted_hash}")
 
         # Check integrity
-        meta_path = encrypted_file_path + ".meta"
-        if os.path.exists(meta_path):
-            with open(meta_path, "r") as meta_file:
-                original_hash = meta_file.read().strip()
-                if original_hash != decrypted_hash:
-                    log_event("WARNING: Decrypted image hash mismatch!")
-                    messagebox.showwarning("Integrity Alert", "Hash mismatch detected! File may be tampered with or wrong PIN used.")
-                else:
-                    log_event("Image integrity verified successfully.")
+        if stats['integrity_verified'] is None:
+            log_event("No embedded digest or .meta file found. Skipping integrity check.")
+        elif not stats['integrity_verified']:
+            log_event("WARNING: Decrypted image hash mismatch!")
         else:
-            log_event("No .meta file found. Skipping integrity check.")
-
-        # Load and process image
-        img = Image.open(io.BytesIO(decrypted_data)).convert('RGB')
-        entropy_after = calculate_entropy(img)
-
-        # Reverse pixel shift
-        unshifted_img = reverse_unshift_pixels(img)
+            log_event("Image integrity verified successfully.")
 
-        # Ask where to save
-        save_path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG Image", "*.png")])
-        if save_path:
-            Image.fromarray(unshifted_img).save(save_path)
-
-            # Show preview
-            Image.fromarray(unshifted_img).show()
-
-            # Get size after save
-            size_after = get_file_size_kb(save_path)
-
-            # Clean up
-            os.remove(encrypted_file_path)
-            if os.path.exists(meta_path):
-                os.remove(meta_path)
-
-            log_event(f"Image decrypted and saved to: {save_path}")
-            log_event("Encrypted and meta files deleted after successful decryption.")
-            messagebox.showinfo("Success", f"Image decrypted and saved to: {save_path}\nEncrypted file deleted.")
-
-            # === CHART: Entropy + File Size ===
-            entropy_before = 8.0  # Approximate for encrypted
-            fig, axes = plt.subplots(1, 2, figsize=(10, 4))
-
-            # Entropy
-            bars1 = axes[0].bar(["Encrypted", "Decrypted"], [entropy_before, entropy_after], color=["red", "skyblue"])
-            axes[0].set_title("Entropy Comparison")
-            axes[0].set_ylabel("Entropy")
-            axes[0].set_ylim(0, 8.5)
-            for bar, val in zip(bars1, [entropy_before, entropy_after]):
-                axes[0].text(bar.get_x() + bar.get_width() / 2, val + 0.1, f"{val:.2f}", ha='center')
-
-            # File size
-            bars2 = axes[1].bar(["Encrypted (KB)", "Decrypted (KB)"], [size_before, size_after], color=["green", "orange"])
-            axes[1].set_title("File Size Comparison")
-            axes[1].set_ylabel("Size (KB)")
-            axes[1].set_ylim(0, max(size_before, size_after) * 1.3)
-            for bar, val in zip(bars2, [size_before, size_after]):
-                axes[1].text(bar.get_x() + bar.get_width() / 2, val + 1, f"{val:.2f} KB", ha='center')
-
-            plt.tight_layout()
-            plt.show()
+        # Clean up
+        os.remove(encrypted_file_path)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
 
-    except UnidentifiedImageError:
-        log_event("Decryption failed: Invalid image or wrong PIN.")
-        messagebox.showerror("Error", "Decryption failed: Invalid image or wrong PIN.")
+        log_event(f"Image decrypted and saved to: {save_path}")
+        log_event("Encrypted and meta files deleted after successful decryption.")
     except Exception as e:
         log_event(f"Decryption failed: {e}")
-        messagebox.showerror("Error", f"Decryption failed. {e}")
+        raise
+
+    stats.update({
+        'save_path': save_path,
+        'size_before': size_before,
+        'size_after': get_file_size_kb(save_path),
+    })
+    return stats
+
+def show_decryption_chart(parent, stats):
+    entropy_before, entropy_after = stats['entropy_before'], stats['entropy_after']
+    size_before, size_after = stats['size_before'], stats['size_after']
+
+    chart_window = tk.Toplevel(parent)
+    chart_window.title(f"Decryption Stats - {os.path.basename(stats['save_path'])}")
+
+    # === CHART: Entropy + File Size ===
+    fig = Figure(figsize=(10, 4))
+    axes = fig.subplots(1, 2)
+
+    # Entropy
+    bars1 = axes[0].bar(["Encrypted", "Decrypted"], [entropy_before, entropy_after], color=["red", "skyblue"])
+    axes[0].set_title("Entropy Comparison")
+    axes[0].set_ylabel("Entropy")
+    axes[0].set_ylim(0, 8.5)
+    for bar, val in zip(bars1, [entropy_before, entropy_after]):
+        axes[0].text(bar.get_x() + bar.get_width() / 2, val + 0.1, f"{val:.2f}", ha='center')
+
+    # File size
+    bars2 = axes[1].bar(["Encrypted (KB)", "Decrypted (KB)"], [size_before, size_after], color=["green", "orange"])
+    axes[1].set_title("File Size Comparison")
+    axes[1].set_ylabel("Size (KB)")
+    axes[1].set_ylim(0, max(size_before, size_after) * 1.3)
+    for bar, val in zip(bars2, [size_before, size_after]):
+        axes[1].text(bar.get_x() + bar.get_width() / 2, val + 1, f"{val:.2f} KB", ha='center')
+
+    fig.tight_layout()
+    # Embedded in a Toplevel instead of plt.show(), so the main loop keeps running
+    canvas = FigureCanvasTkAgg(fig, master=chart_window)
+    canvas.draw()
+    canvas.get_tk_widget().pack(expand=True, fill='both')
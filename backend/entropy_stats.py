@@ -0,0 +1,182 @@
+"""
+Entropy statistics reported with encryption and decryption results.
+
+STATS_MODE (environment, read per call) selects how they are computed:
+    exact    full grayscale histogram, fused into the pixel shift pass
+    sampled  STATS_SAMPLE_SIZE pixels (or ciphertext bytes) drawn at random; exact
+             for anything smaller. The estimate is Miller-Madow bias corrected and
+             comes with a 95% margin in stats['entropy_margin']
+    off      no entropy stats (reported as None)
+
+Samples are drawn at random rather than on a stride: the pixel shift is periodic
+in the pixel index, so a fixed stride can alias with it.
+"""
+import math
+import os
+import numpy as np
+from fernet_stream import FERNET_HMAC, FERNET_PREFIX, READ_BLOCK, decode_base64url
+from key_utils import entropy_from_histogram
+from pixel_shift import luma_histogram, reverse_shift_pixels, reverse_unshift_pixels, \
+    shift_pixels_with_histograms, unshift_pixels_with_histogram
+
+STATS_MODES = ('exact', 'sampled', 'off')
+DEFAULT_STATS_MODE = 'sampled'
+DEFAULT_SAMPLE_SIZE = 256 * 1024
+Z_95 = 1.96
+SAMPLE_SEED = 0  # Fixed, so the same input always reports the same estimate
+
+
+def get_stats_mode(mode=None):
+    mode = (mode or os.getenv('STATS_MODE', DEFAULT_STATS_MODE)).lower()
+    if mode not in STATS_MODES:
+        raise ValueError(f"Stats mode must be one of: {', '.join(STATS_MODES)}")
+    return mode
+
+
+def sample_size(mode, parts=1):
+    """Items to draw per part (frame, chunk) in sampled mode; None means count everything"""
+    if mode != 'sampled':
+        return None
+    return max(1, int(os.getenv('STATS_SAMPLE_SIZE', DEFAULT_SAMPLE_SIZE)) // max(1, parts))
+
+
+def entropy_with_margin(histogram, sampled=False):
+    """Shannon entropy in bits and its 95% margin (0.0 when every item was counted)"""
+    counts = np.asarray(histogram, dtype=np.float64)
+    n = counts.sum()
+    if not sampled or n == 0:
+        return entropy_from_histogram(counts) if n else 0.0, 0.0
+    p = counts[counts > 0] / n
+    log_p = np.log2(p)
+    plug_in = -float(np.sum(p * log_p))
+    bins = len(p)
+    # The plug-in estimate is biased low by about (bins - 1) / 2n nats (Miller-Madow)
+    entropy = min(plug_in + (bins - 1) / (2 * n * math.log(2)), math.log2(len(counts)))
+    # Delta-method variance, plus the second-order term that dominates near uniform
+    variance = (float(np.sum(p * log_p ** 2)) - plug_in ** 2) / n + (bins - 1) / (2 * (n * math.log(2)) ** 2)
+    return round(float(entropy), 4), round(Z_95 * math.sqrt(max(variance, 0.0)), 4)
+
+
+def ciphertext_histogram(token, sample=None, rng=None):
+    """
+    Byte histogram of the AES ciphertext inside a Fernet token (base64url bytes);
+    version, timestamp, IV and HMAC are left out. sample draws that many bytes at
+    random (in whole base64 groups). Returns (histogram, sampled).
+    """
+    hist = np.zeros(256, dtype=np.int64)
+    decoded_len = len(token) // 4 * 3 - (len(token) - len(token.rstrip(b'=')))
+    first = -(-FERNET_PREFIX // 3)  # First base64 group holding only ciphertext
+    last = (decoded_len - FERNET_HMAC) // 3
+    if last <= first:
+        return hist, False
+
+    if sample is not None and sample < (last - first) * 3:
+        rng = rng or np.random.default_rng()
+        groups = np.frombuffer(token, dtype=np.uint8, count=len(token) // 4 * 4).reshape(-1, 4)
+        picked = groups[rng.integers(first, last, size=-(-sample // 3))]
+        data = decode_base64url(picked.tobytes())
+        hist += np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+        return hist, True
+
+    for start in range(first * 4, last * 4, READ_BLOCK):
+        data = decode_base64url(token[start:min(start + READ_BLOCK, last * 4)])
+        hist += np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    return hist, False
+
+
+class EntropyTally:
+    """
+    Grayscale or ciphertext byte histogram summed over one or more parts (frames,
+    chunks). In sampled mode each part draws its share of STATS_SAMPLE_SIZE.
+    """
+
+    def __init__(self, mode=None, parts=1):
+        self.mode = get_stats_mode(mode)
+        self.sample = sample_size(self.mode, parts)
+        self.hist = np.zeros(256, dtype=np.int64)
+        self.sampled = False
+        self._rng = np.random.default_rng(SAMPLE_SEED)
+
+    @property
+    def active(self):
+        return self.mode != 'off'
+
+    def add_histogram(self, hist, sampled=False):
+        self.hist += hist
+        self.sampled |= sampled
+
+    def add_image(self, image):
+        if self.active:
+            self.add_histogram(*luma_histogram(image, self.sample, self._rng))
+
+    def add_ciphertext(self, token):
+        if self.active:
+            self.add_histogram(*ciphertext_histogram(token, self.sample, self._rng))
+
+    def result(self):
+        """(entropy, margin), or (None, None) when stats are off"""
+        if not self.active:
+            return None, None
+        return entropy_with_margin(self.hist, self.sampled)
+
+
+def shift_counting(image, before, after):
+    """Pixel shift for encryption, adding the input and output histograms to two tallies"""
+    if before.mode == 'exact':
+        shifted, hist_before, hist_after = shift_pixels_with_histograms(image)
+        before.add_histogram(hist_before)
+        after.add_histogram(hist_after)
+        return shifted
+    shifted = reverse_shift_pixels(image)
+    before.add_image(image)
+    after.add_image(shifted)
+    return shifted
+
+
+def unshift_counting(image, tally):
+    """Reverse pixel shift, adding the (still shifted) input's histogram to tally"""
+    if tally.mode == 'exact':
+        unshifted, hist = unshift_pixels_with_histogram(image)
+        tally.add_histogram(hist)
+        return unshifted
+    tally.add_image(image)
+    return reverse_unshift_pixels(image)
+
+
+def ciphertext_entropy(token, mode=None):
+    """(entropy, margin) of a Fernet token's ciphertext bytes, or (None, None) when stats are off"""
+    tally = EntropyTally(mode)
+    tally.add_ciphertext(token)
+    return tally.result()
+
+
+def image_entropy(image, mode=None):
+    """(entropy, margin) of an image's grayscale values, or (None, None) when stats are off"""
+    tally = EntropyTally(mode)
+    tally.add_image(image)
+    return tally.result()
+
+
+def entropy_fields(mode, before, after):
+    """Stats entries for two (entropy, margin) measurements"""
+    margins = [margin for _, margin in (before, after) if margin is not None]
+    return {
+        'entropy_before': before[0],
+        'entropy_after': after[0],
+        'entropy_margin': max(margins) if margins else None,
+        'stats_mode': get_stats_mode(mode),
+    }
+
+
+def shift_with_entropy(image, mode=None):
+    """Pixel shift for encryption plus the entropy before and after it. Returns (shifted, stats fields)."""
+    before, after = EntropyTally(mode), EntropyTally(mode)
+    shifted = shift_counting(image, before, after)
+    return shifted, entropy_fields(before.mode, before.result(), after.result())
+
+
+def unshift_with_entropy(image, mode=None):
+    """Reverse pixel shift plus the (still shifted) input's entropy. Returns (unshifted, (entropy, margin))."""
+    tally = EntropyTally(mode)
+    unshifted = unshift_counting(image, tally)
+    return unshifted, tally.result()
@@ -0,0 +1,162 @@
+"""
+Streaming Fernet primitives, byte-compatible with cryptography.fernet.
+
+Fernet token: base64url(0x80 | timestamp (8) | IV (16) | AES-128-CBC ciphertext | HMAC-SHA256 (32)).
+The token is processed in blocks, so memory stays flat for any payload size.
+"""
+import base64
+import binascii
+import os
+import struct
+import time
+from cryptography.exceptions import InvalidSignature
+from cryptography.fernet import InvalidToken
+from cryptography.hazmat.primitives import hashes, hmac, padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from key_utils import generate_key_from_pin
+
+READ_BLOCK = 1024 * 1024  # Multiple of 4, so blocks split on base64 boundaries
+FERNET_VERSION = 0x80
+FERNET_PREFIX = 1 + 8 + 16  # version, timestamp, IV
+FERNET_HMAC = 32
+# a2b_base64 on translated input skips urlsafe_b64decode's extra copies
+_URLSAFE_TO_STANDARD = bytes.maketrans(b'-_', b'+/')
+
+
+def fernet_key_bytes(pin):
+    """Raw 32-byte Fernet key (signing half, encryption half) for a PIN"""
+    return base64.urlsafe_b64decode(generate_key_from_pin(pin))
+
+
+def decode_base64url(data):
+    """Decode base64url whose length is a multiple of 4; raises binascii.Error"""
+    return binascii.a2b_base64(data.translate(_URLSAFE_TO_STANDARD))
+
+
+def iter_token_bytes(fp, length=None):
+    """Yield base64url-decoded bytes of a token read from fp (to EOF, or `length` chars)"""
+    remaining = length
+    carry = b''
+    while remaining is None or remaining > 0:
+        data = fp.read(READ_BLOCK if remaining is None else min(READ_BLOCK, remaining))
+        if not data:
+            break
+        if remaining is not None:
+            remaining -= len(data)
+        data = carry + data
+        cut = len(data) - len(data) % 4
+        carry = data[cut:]
+        if cut:
+            try:
+                yield decode_base64url(data[:cut])
+            except binascii.Error:
+                raise InvalidToken
+    if carry or (remaining is not None and remaining > 0):
+        raise InvalidToken
+
+
+class TokenDecryptor:
+    """
+    Push-style Fernet authentication and decryption: feed the token with update()
+    (base64url text, any split) or update_decoded() (raw bytes), then finalize().
+    With a sink, plaintext is passed to sink(bytes) as it is decrypted; it is only
+    trusted once finalize() returns. Raises InvalidToken on a wrong key or tampered token.
+    """
+
+    def __init__(self, key, sink=None):
+        self.sink = sink
+        self._encryption_key = key[16:]
+        self._mac = hmac.HMAC(key[:16], hashes.SHA256())
+        self._head = b''
+        self._tail = b''
+        self._carry = b''  # base64 text waiting for a multiple of 4
+        self._decryptor = self._unpadder = None
+
+    def update(self, token_text):
+        data = self._carry + token_text
+        cut = len(data) - len(data) % 4
+        self._carry = data[cut:]
+        if cut:
+            try:
+                self.update_decoded(decode_base64url(data[:cut]))
+            except binascii.Error:
+                raise InvalidToken
+
+    def update_decoded(self, block):
+        # Hold back the trailing HMAC; everything before it is authenticated
+        data = self._tail + block
+        self._tail = data[-FERNET_HMAC:]
+        data = data[:-FERNET_HMAC]
+        if not data:
+            return
+        self._mac.update(data)
+        if len(self._head) < FERNET_PREFIX:
+            needed = FERNET_PREFIX - len(self._head)
+            self._head += data[:needed]
+            data = data[needed:]
+            if len(self._head) == FERNET_PREFIX:
+                if self._head[0] != FERNET_VERSION:
+                    raise InvalidToken
+                if self.sink:
+                    self._decryptor = Cipher(algorithms.AES(self._encryption_key), modes.CBC(self._head[9:])).decryptor()
+                    self._unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        if self._decryptor and data:
+            self.sink(self._unpadder.update(self._decryptor.update(data)))
+
+    def finalize(self):
+        if self._carry or len(self._head) < FERNET_PREFIX or len(self._tail) != FERNET_HMAC:
+            raise InvalidToken
+        try:
+            self._mac.verify(self._tail)
+        except InvalidSignature:
+            raise InvalidToken
+        if self._decryptor:
+            try:
+                self.sink(self._unpadder.update(self._decryptor.finalize()) + self._unpadder.finalize())
+            except ValueError:
+                raise InvalidToken
+
+
+def decrypt_token_stream(decoded_blocks, key, sink=None):
+    """
+    Authenticate one Fernet token. With a sink, the plaintext is decrypted in
+    pieces and passed to sink(bytes); it is only trusted once this returns.
+    Raises InvalidToken on a wrong key or tampered token.
+    """
+    decryptor = TokenDecryptor(key, sink)
+    for block in decoded_blocks:
+        decryptor.update_decoded(block)
+    decryptor.finalize()
+
+
+class TokenWriter:
+    """Write a Fernet token for plaintext fed in pieces via write(); close() appends the HMAC"""
+
+    def __init__(self, fp, key):
+        self.fp = fp
+        self._mac = hmac.HMAC(key[:16], hashes.SHA256())
+        iv = os.urandom(16)
+        self._encryptor = Cipher(algorithms.AES(key[16:]), modes.CBC(iv)).encryptor()
+        self._padder = padding.PKCS7(algorithms.AES.block_size).padder()
+        self._pending = b''  # Raw bytes waiting for a multiple of 3 to base64-encode
+        self._emit(bytes([FERNET_VERSION]) + struct.pack('>Q', int(time.time())) + iv)
+
+    def _encode(self, raw):
+        data = self._pending + raw
+        cut = len(data) - len(data) % 3
+        if cut:
+            self.fp.write(base64.urlsafe_b64encode(data[:cut]))
+        self._pending = data[cut:]
+
+    def _emit(self, raw):
+        self._mac.update(raw)
+        self._encode(raw)
+
+    def write(self, plaintext):
+        self._emit(self._encryptor.update(self._padder.update(plaintext)))
+
+    def close(self):
+        self._emit(self._encryptor.update(self._padder.finalize()) + self._encryptor.finalize())
+        self._encode(self._mac.finalize())
+        self.fp.write(base64.urlsafe_b64encode(self._pending))
+        self._pending = b''
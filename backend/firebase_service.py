@@ -3,33 +3,53 @@ from firebase_admin import credentials, firestore, storage
 import os
 from datetime import datetime
 import tempfile
+from ttl_cache import TTLCache
+from sharded_counter import ShardedCounter
+
+# Read-through cache settings for logs and profiles (per process; writes invalidate locally)
+CACHE_TTL_SECONDS = float(os.getenv('FIREBASE_CACHE_TTL', '30'))
+CACHE_MAX_ENTRIES = int(os.getenv('FIREBASE_CACHE_SIZE', '1024'))
+LOG_FIELDS = ['timestamp', 'activityType', 'details']
 
 class FirebaseService:
-    def __init__(self):
-        # Initialize Firebase Admin SDK
-        if not firebase_admin._apps:
-            # For local development, use service account key
-            # For production, use environment variables
-            try:
-                cred = credentials.Certificate("firebase-service-account.json")
-                firebase_admin.initialize_app(cred, {
-                    'storageBucket': os.getenv('FIREBASE_STORAGE_BUCKET')
-                })
-            except:
-                # Fallback for production deployment or local testing
+    def __init__(self, db=None, bucket=None):
+        if db is not None:
+            # Injected client (e.g. a local Firestore fake); skip Admin SDK initialisation
+            self.db = db
+            self.bucket = bucket
+        else:
+            # Initialize Firebase Admin SDK
+            if not firebase_admin._apps:
+                # For local development, use service account key
+                # For production, use environment variables
                 try:
-                    firebase_admin.initialize_app()
+                    cred = credentials.Certificate("firebase-service-account.json")
+                    firebase_admin.initialize_app(cred, {
+                        'storageBucket': os.getenv('FIREBASE_STORAGE_BUCKET')
+                    })
                 except:
-                    # Skip Firebase for local development if not configured
-                    pass
+                    # Fallback for production deployment or local testing
+                    try:
+                        firebase_admin.initialize_app()
+                    except:
+                        # Skip Firebase for local development if not configured
+                        pass
         
-        try:
-            self.db = firestore.client()
-            self.bucket = storage.bucket()
-        except:
-            # Fallback for local development
-            self.db = None
-            self.bucket = None
+            try:
+                self.db = firestore.client()
+                self.bucket = storage.bucket()
+            except:
+                # Fallback for local development
+                self.db = None
+                self.bucket = None
+
+        self.logs_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+        self.profile_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+        self.encryption_counter = ShardedCounter(
+            self.db, on_flush=lambda user_id: self._invalidate_user(self.profile_cache, user_id))
+
+    def _invalidate_user(self, cache, user_id):
+        cache.discard_where(lambda key: key[0] == user_id)
     
     def upload_file(self, file_data, file_path, user_id):
         """Upload file to Firebase Storage"""
@@ -69,31 +89,74 @@ class FirebaseService:
                 'timestamp': datetime.now(),
                 'ip': None  # Can be added from request context
             })
+            self._invalidate_user(self.logs_cache, user_id)
             return {"success": True}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def get_user_logs(self, user_id):
-        """Get user activity logs from Firestore"""
+    def get_user_logs(self, user_id, limit=100, cursor=None, fields=None):
+        """
+        Get a page of user activity logs from Firestore, newest first.
+        Pass the returned next_cursor back as cursor to fetch the following page;
+        fields projects each log down to the listed fields (default LOG_FIELDS).
+        """
+        fields = list(fields or LOG_FIELDS)
+        key = (user_id, limit, cursor, tuple(fields))
         try:
-            docs = self.db.collection('activity_logs')\
-                          .where('userId', '==', user_id)\
-                          .order_by('timestamp', direction=firestore.Query.DESCENDING)\
-                          .limit(100)\
-                          .stream()
-            
-            logs = []
-            for doc in docs:
-                log_data = doc.to_dict()
-                logs.append({
-                    'id': doc.id,
-                    'timestamp': log_data.get('timestamp'),
-                    'activityType': log_data.get('activityType'),
-                    'details': log_data.get('details')
-                })
-            return {"success": True, "logs": logs}
+            page = self.logs_cache.get_or_load(key, lambda: self._load_user_logs(user_id, limit, cursor, fields))
+            return {"success": True, "logs": page['logs'], "next_cursor": page['next_cursor']}
         except Exception as e:
             return {"success": False, "error": str(e)}
+
+    def _load_user_logs(self, user_id, limit, cursor, fields):
+        # Document id breaks timestamp ties, so logs sharing the boundary timestamp are not skipped
+        logs_ref = self.db.collection('activity_logs')
+        query = logs_ref.where('userId', '==', user_id)\
+                        .order_by('timestamp', direction=firestore.Query.DESCENDING)\
+                        .order_by('__name__', direction=firestore.Query.DESCENDING)\
+                        .select(sorted(set(fields) | {'timestamp'}))
+        if cursor:
+            # The cursor is the last document's id; its snapshot carries the exact stored timestamp
+            last_doc = logs_ref.document(cursor).get()
+            if not last_doc.exists:
+                raise ValueError("Invalid cursor")
+            query = query.start_after(last_doc)
+
+        logs = []
+        for doc in query.limit(limit).stream():
+            log_data = doc.to_dict()
+            log = {'id': doc.id}
+            log.update({field: log_data.get(field) for field in fields})
+            logs.append(log)
+
+        next_cursor = logs[-1]['id'] if len(logs) == limit else None
+        return {'logs': logs, 'next_cursor': next_cursor}
+
+    def get_user_profile(self, user_id, fields=None):
+        """Get a user profile from Firestore, optionally projected to the listed fields"""
+        key = (user_id, tuple(fields) if fields else None)
+        try:
+            profile = self.profile_cache.get_or_load(key, lambda: self._load_user_profile(user_id, fields))
+            return {"success": True, "profile": profile}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def _load_user_profile(self, user_id, fields):
+        doc = self.db.collection('users').document(user_id).get(field_paths=fields)
+        # Missing profiles are not cached (get_or_load skips None), so a new profile shows up at once
+        if not doc.exists:
+            return None
+        profile = doc.to_dict()
+        if not fields or 'encryptionCount' in fields or 'lastActivity' in fields:
+            # encryptionCount on the user document only holds pre-sharding counts
+            shards = self.encryption_counter.read(user_id)
+            if not fields or 'encryptionCount' in fields:
+                profile['encryptionCount'] = profile.get('encryptionCount', 0) + shards['count']
+            if shards['lastActivity'] and (not fields or 'lastActivity' in fields):
+                last_activity = profile.get('lastActivity')
+                if last_activity is None or shards['lastActivity'] > last_activity:
+                    profile['lastActivity'] = shards['lastActivity']
+        return profile
     
     def create_user_profile(self, user_id, email):
         """Create user profile in Firestore"""
@@ -105,18 +168,20 @@ class FirebaseService:
                 'encryptionCount': 0,
                 'lastActivity': datetime.now()
             })
+            self._invalidate_user(self.profile_cache, user_id)
             return {"success": True}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def update_encryption_count(self, user_id):
-        """Increment user's encryption count"""
+    def update_encryption_count(self, user_id, amount=1):
+        """
+        Increment user's encryption count on a random counter shard. With
+        FIREBASE_COUNTER_FLUSH_SECONDS set, increments are batched locally and
+        show up in get_user_profile after the next flush.
+        """
         try:
-            doc_ref = self.db.collection('users').document(user_id)
-            doc_ref.update({
-                'encryptionCount': firestore.Increment(1),
-                'lastActivity': datetime.now()
-            })
+            self.encryption_counter.increment(user_id, amount)
+            self._invalidate_user(self.profile_cache, user_id)
             return {"success": True}
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -0,0 +1,156 @@
+"""
+In-memory stand-in for the Firestore client, for running ShardedCounter and
+FirebaseService without credentials or the emulator:
+
+    db = FakeFirestore()
+    service = FirebaseService(db=db)
+
+Covers what this app uses: collections and documents (nested too), set() with
+merge, update(), get(field_paths=), stream(), Increment transforms and
+transactions. One lock guards the whole store, so each write is atomic, as on
+the server; transactions check at commit that nothing they read has changed
+and are retried by transactional().
+"""
+import copy
+import threading
+import uuid
+from firebase_admin import firestore
+
+MAX_TRANSACTION_ATTEMPTS = 5
+
+
+class TransactionConflict(Exception):
+    """A document read in the transaction changed before it committed"""
+
+
+def _apply(current, data):
+    merged = dict(current)
+    for field, value in data.items():
+        if isinstance(value, firestore.Increment):
+            merged[field] = merged.get(field, 0) + value.value
+        else:
+            merged[field] = copy.deepcopy(value)
+    return merged
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, field_paths=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        if data is not None and field_paths:
+            data = {field: data[field] for field in field_paths if field in data}
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class DocumentReference:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return CollectionReference(self._db, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        with self._db._lock:
+            data, version = self._db._docs.get(self.path, (None, 0))
+            if transaction is not None:
+                transaction._read_versions.setdefault(self.path, version)
+            return DocumentSnapshot(self, copy.deepcopy(data), field_paths)
+
+    def set(self, data, merge=False):
+        with self._db._lock:
+            self._db._write(self.path, data, merge=merge)
+
+    def update(self, data):
+        with self._db._lock:
+            if self.path not in self._db._docs:
+                raise KeyError(f"No document to update: {self.path}")
+            self._db._write(self.path, data, merge=True)
+
+    def delete(self):
+        with self._db._lock:
+            self._db._docs.pop(self.path, None)
+
+
+class CollectionReference:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return DocumentReference(self._db, f"{self.path}/{document_id or uuid.uuid4().hex}")
+
+    def stream(self):
+        prefix = self.path + '/'
+        with self._db._lock:
+            docs = [(path, copy.deepcopy(data)) for path, (data, _) in self._db._docs.items()
+                    if path.startswith(prefix) and '/' not in path[len(prefix):]]
+        for path, data in sorted(docs):
+            yield DocumentSnapshot(DocumentReference(self._db, path), data)
+
+
+class Transaction:
+    """Buffers writes; commit applies them only if every document read is unchanged"""
+
+    def __init__(self, db):
+        self._db = db
+        self._read_versions = {}
+        self._writes = []
+
+    def get(self, reference, field_paths=None):
+        return reference.get(field_paths=field_paths, transaction=self)
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference.path, data, merge))
+
+    def update(self, reference, data):
+        self._writes.append((reference.path, data, True))
+
+    def commit(self):
+        with self._db._lock:
+            for path, version in self._read_versions.items():
+                if self._db._docs.get(path, (None, 0))[1] != version:
+                    raise TransactionConflict(path)
+            for path, data, merge in self._writes:
+                self._db._write(path, data, merge=merge)
+
+
+def transactional(func):
+    """Like firestore.transactional: call func(transaction, ...) and commit, retrying on conflict"""
+    def run(transaction, *args, **kwargs):
+        for attempt in range(MAX_TRANSACTION_ATTEMPTS):
+            transaction._read_versions, transaction._writes = {}, []
+            result = func(transaction, *args, **kwargs)
+            try:
+                transaction.commit()
+                return result
+            except TransactionConflict:
+                if attempt == MAX_TRANSACTION_ATTEMPTS - 1:
+                    raise
+    return run
+
+
+class FakeFirestore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}  # path -> (data, version)
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def transaction(self):
+        return Transaction(self)
+
+    def _write(self, path, data, merge):
+        # Caller holds self._lock
+        current, version = self._docs.get(path, (None, 0))
+        self._docs[path] = (_apply(current if merge and current else {}, data), version + 1)
@@ -0,0 +1,224 @@
+"""
+Frame-streaming pipeline for animated GIF/APNG and multi-page TIFF.
+
+Each frame is shifted, PNG-encoded and Fernet-encrypted as its own chunk, so only
+one decoded frame is ever in memory. Container token area for multi-frame files:
+
+    CHUNK_LEN (4) | Fernet(JSON metadata) | CHUNK_LEN (4) | Fernet(DURATION_MS (4) + frame PNG) | ...
+
+The header digest covers the concatenated frame PNG bytes and is patched in
+once the last frame has been written.
+"""
+import io
+import json
+import os
+import struct
+import zlib
+from cryptography.fernet import Fernet
+from PIL import Image, ImageSequence, TiffImagePlugin
+from pixel_shift import permute_pixels, unpermute_pixels
+from key_utils import generate_key_from_pin
+from entropy_stats import EntropyTally, entropy_fields, shift_counting, unshift_counting
+from container import (DEFAULT_HASH_ALGO, HEADER_FIXED_SIZE, PERMUTATION_SALT_BYTES, ContainerError,
+                       HashingReader, HashingWriter, atomic_output, build_header, new_hasher)
+from admission import estimate_peak_bytes
+
+CHUNK_LENGTH = struct.Struct('>I')
+FRAME_DURATION = struct.Struct('>I')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def is_multi_frame(image):
+    return getattr(image, 'n_frames', 1) > 1
+
+
+def _write_chunk(fp, token):
+    fp.write(CHUNK_LENGTH.pack(len(token)))
+    fp.write(token)
+
+
+def _read_chunk(fp):
+    prefix = fp.read(CHUNK_LENGTH.size)
+    if len(prefix) != CHUNK_LENGTH.size:
+        raise ContainerError("Truncated frame stream")
+    (length,) = CHUNK_LENGTH.unpack(prefix)
+    token = fp.read(length)
+    if len(token) != length:
+        raise ContainerError("Truncated frame chunk")
+    return token
+
+
+def encrypt_frames(image, pin, output_path, hash_algo=DEFAULT_HASH_ALGO, scramble=False, stats_mode=None):
+    """Stream every frame of an opened multi-frame image into a container file. Returns stats."""
+    fernet = Fernet(generate_key_from_pin(pin))
+    hasher = new_hasher(hash_algo)
+    permutation_salt = os.urandom(PERMUTATION_SALT_BYTES) if scramble else None
+    n_frames = image.n_frames
+    entropy_before, entropy_after = EntropyTally(stats_mode, n_frames), EntropyTally(stats_mode, n_frames)
+
+    with atomic_output(output_path) as fp:
+        # Digest is unknown until every frame is written; reserve its bytes and patch them at the end
+        fp.write(build_header(hash_algo, '00' * hasher.digest_size, permutation_salt, multi_frame=True))
+        meta = {
+            'format': image.format,
+            'n_frames': n_frames,
+            'loop': image.info.get('loop', 0),
+        }
+        _write_chunk(fp, fernet.encrypt(json.dumps(meta).encode()))
+
+        for frame in ImageSequence.Iterator(image):
+            shifted = shift_counting(frame.convert('RGB'), entropy_before, entropy_after)
+            if permutation_salt:
+                shifted = permute_pixels(shifted, pin, permutation_salt)
+
+            buffer = io.BytesIO()
+            buffer.write(FRAME_DURATION.pack(int(frame.info.get('duration', 0))))
+            Image.fromarray(shifted).save(HashingWriter(buffer, hasher), format='PNG')
+            del shifted
+            _write_chunk(fp, fernet.encrypt(buffer.getvalue()))
+
+        original_hash = hasher.hexdigest()
+        fp.seek(HEADER_FIXED_SIZE)
+        fp.write(bytes.fromhex(original_hash))
+
+    return {
+        **entropy_fields(entropy_before.mode, entropy_before.result(), entropy_after.result()),
+        'original_hash': original_hash,
+        'hash_algo': hash_algo,
+        'frames': n_frames,
+        'scrambled': scramble,
+    }
+
+
+class ApngFrameWriter:
+    """
+    Writes an APNG one frame at a time. Each frame is encoded by Pillow as a
+    standalone PNG and its IDAT data is re-chunked into fcTL/fdAT, so no frame
+    list is kept (Pillow's own APNG/GIF writers hold every frame in memory).
+    """
+
+    def __init__(self, fp, n_frames, loop=0):
+        self.fp = fp
+        self.n_frames = n_frames
+        self.loop = loop
+        self.sequence = 0
+        self.size = None
+
+    def _chunk(self, chunk_type, data):
+        self.fp.write(struct.pack('>I', len(data)) + chunk_type + data)
+        self.fp.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    def _next_sequence(self):
+        sequence = self.sequence
+        self.sequence += 1
+        return struct.pack('>I', sequence)
+
+    def add_frame(self, pixels, duration):
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='PNG')
+        png = buffer.getvalue()
+        height, width = pixels.shape[:2]
+        first = self.size is None
+        if first:
+            self.size = (width, height)
+            self.fp.write(PNG_SIGNATURE)
+        elif self.size != (width, height):
+            raise ValueError("All animation frames must have the same size")
+
+        offset = len(PNG_SIGNATURE)
+        while offset < len(png):
+            (length,) = struct.unpack_from('>I', png, offset)
+            chunk_type = png[offset + 4:offset + 8]
+            data = png[offset + 8:offset + 8 + length]
+            offset += 12 + length
+
+            if chunk_type == b'IHDR':
+                if first:
+                    self._chunk(b'IHDR', data)
+                    self._chunk(b'acTL', struct.pack('>II', self.n_frames, self.loop))
+                # delay = duration/1000 s, dispose none, blend source
+                self._chunk(b'fcTL', self._next_sequence() +
+                            struct.pack('>IIIIHHBB', width, height, 0, 0, min(duration, 0xffff), 1000, 0, 0))
+            elif chunk_type == b'IDAT':
+                if first:
+                    self._chunk(b'IDAT', data)
+                else:
+                    self._chunk(b'fdAT', self._next_sequence() + data)
+            elif chunk_type == b'IEND':
+                break
+            elif first:
+                self._chunk(chunk_type, data)
+
+    def close(self):
+        self._chunk(b'IEND', b'')
+
+
+class TiffFrameWriter:
+    """Appends one page at a time to a multi-page TIFF (pages may differ in size)"""
+
+    def __init__(self, fp):
+        self.writer = TiffImagePlugin.AppendingTiffWriter(fp)
+
+    def add_frame(self, pixels, duration):
+        Image.fromarray(pixels).save(self.writer, format='TIFF')
+        self.writer.newFrame()
+
+    def close(self):
+        # newFrame() already finalised the last page; the caller owns fp
+        pass
+
+
+def decrypt_frames(fp, header, pin, output_base, admission=None, stats_mode=None):
+    """
+    Decrypt a multi-frame container from fp (positioned after the header) into
+    output_base + '.png' (APNG) or '.tif' (multi-page TIFF). Returns (output_path, stats).
+    Raises ValueError on an integrity mismatch; the output is then not written.
+    """
+    fernet = Fernet(generate_key_from_pin(pin))
+    meta = json.loads(fernet.decrypt(_read_chunk(fp)))
+    hasher = new_hasher(header.hash_algo) if header.digest else None
+    is_tiff = meta['format'] == 'TIFF'
+    output_path = output_base + ('.tif' if is_tiff else '.png')
+    entropy_before = EntropyTally(stats_mode, meta['n_frames'])
+    entropy_after = EntropyTally(stats_mode, meta['n_frames'])
+    admitted_cost = 0
+    integrity_verified = None
+
+    try:
+        with atomic_output(output_path) as out:
+            writer = TiffFrameWriter(out) if is_tiff else ApngFrameWriter(out, meta['n_frames'], meta['loop'])
+            for _ in range(meta['n_frames']):
+                token = _read_chunk(fp)
+                entropy_before.add_ciphertext(token)
+                plaintext = fernet.decrypt(token)
+                del token
+                (duration,) = FRAME_DURATION.unpack_from(plaintext)
+                reader = HashingReader(io.BytesIO(plaintext[FRAME_DURATION.size:]), [hasher] if hasher else [])
+                del plaintext
+                img = Image.open(reader)
+                if admission is not None:
+                    # Peak memory is one frame: hold the largest frame's cost seen so far
+                    cost = estimate_peak_bytes(img.size, img.mode, 'decrypt')
+                    if cost > admitted_cost:
+                        admission.acquire(cost, held=admitted_cost)
+                        admitted_cost = cost
+                img = img.convert('RGB')
+                reader.finish()
+                if header.permutation_salt:
+                    img = unpermute_pixels(img, pin, header.permutation_salt)
+                writer.add_frame(unshift_counting(img, entropy_after), duration)
+                del img
+            writer.close()
+            if hasher:
+                integrity_verified = hasher.hexdigest() == header.digest
+                if not integrity_verified:
+                    raise ValueError("Hash mismatch detected! File may be tampered with or wrong PIN used.")
+    finally:
+        if admitted_cost:
+            admission.release(admitted_cost)
+
+    return output_path, {
+        **entropy_fields(entropy_before.mode, entropy_before.result(), entropy_after.result()),
+        'frames': meta['n_frames'],
+        'integrity_verified': integrity_verified,
+    }
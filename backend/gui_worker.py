@@ -0,0 +1,63 @@
+import queue
+import threading
+
+from core import Cancelled
+
+
+class BackgroundWorker:
+    """
+    Runs jobs one at a time on a daemon thread so the Tk main loop never blocks.
+    Jobs are called as func(*args, progress=..., cancel_event=...). Results are
+    posted to `events` as (kind, label, payload) tuples, which the Tk thread
+    drains with after(); kind is one of 'progress', 'done', 'error', 'cancelled'.
+    """
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, label, func, *args):
+        with self._lock:
+            generation = self._generation
+        self.jobs.put((generation, label, func, args))
+
+    def cancel(self):
+        """Cancel the running job and drop everything queued before this call"""
+        with self._lock:
+            self._generation += 1
+        self.cancel_event.set()
+
+    def poll(self):
+        """Yield all pending events without blocking (call from the Tk thread)"""
+        while True:
+            try:
+                yield self.events.get_nowait()
+            except queue.Empty:
+                return
+
+    def _run(self):
+        while True:
+            generation, label, func, args = self.jobs.get()
+            with self._lock:
+                stale = generation != self._generation
+                if not stale:
+                    self.cancel_event.clear()
+            if stale:
+                self.events.put(('cancelled', label, None))
+                continue
+
+            def progress(stage, fraction, label=label):
+                self.events.put(('progress', label, (stage, fraction)))
+
+            try:
+                result = func(*args, progress=progress, cancel_event=self.cancel_event)
+                self.events.put(('done', label, result))
+            except Cancelled:
+                self.events.put(('cancelled', label, None))
+            except Exception as e:
+                self.events.put(('error', label, e))
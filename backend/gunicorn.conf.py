@@ -0,0 +1,55 @@
+"""
+Production gunicorn settings: gunicorn -c gunicorn.conf.py app:app (or python serve.py)
+
+The app is preloaded and warmed up in the master, then frozen out of the GC so
+forked workers share those pages copy-on-write. Workers whose RSS passes
+GUNICORN_MAX_WORKER_RSS_MB finish their current request and are replaced.
+"""
+import gc
+import multiprocessing
+import os
+import resource
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5500')}"
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.getenv('GUNICORN_THREADS', '2'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+# Request-count recycling stays as a backstop; jitter avoids all workers restarting together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+# 0 disables RSS-based recycling
+max_worker_rss_mb = int(os.getenv('GUNICORN_MAX_WORKER_RSS_MB', '1024'))
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        # No /proc (macOS): fall back to the peak, which is still a valid recycle signal
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported, before any worker is forked
+    from warmup import warmup
+    warmup()
+    # Keep the collector from touching (and so un-sharing) the objects created so far
+    gc.freeze()
+
+
+def post_request(worker, req, environ, resp):
+    if not max_worker_rss_mb:
+        return
+    rss_mb = current_rss_bytes() / (1024 * 1024)
+    if rss_mb > max_worker_rss_mb:
+        worker.log.warning("Worker %s RSS %.0f MB exceeds %d MB; recycling after this request",
+                           worker.pid, rss_mb, max_worker_rss_mb)
+        worker.alive = False
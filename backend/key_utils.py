@@ -2,10 +2,10 @@ import hashlib
 import base64
 import re
 from datetime import datetime
-import csv
 import os
-from collections import Counter
 import numpy as np
+from log_store import get_log_store
+from pixel_shift import luma_histogram
 
 def generate_key_from_pin(pin):
     key = hashlib.sha256(pin.encode()).digest()
@@ -30,23 +30,19 @@ def get_file_hash(data):
     return sha256.hexdigest()
 
 def log_event(event):
-    os.makedirs("logs", exist_ok=True)
-    log_path = os.path.join("logs", "activity_log.csv")
-    file_exists = os.path.isfile(log_path)
-
-    with open(log_path, "a", newline='') as log_file:
-        writer = csv.writer(log_file)
-        if not file_exists:
-            writer.writerow(["Timestamp", "Event"])
-        writer.writerow([datetime.now().strftime('%Y-%m-%d %H:%M:%S'), event])
+    get_log_store().append(datetime.now().strftime('%Y-%m-%d %H:%M:%S'), event)
 
 def calculate_entropy(image):
-    grayscale = image.convert("L")
-    pixel_values = list(grayscale.getdata())
-    total_pixels = len(pixel_values)
-    frequency = Counter(pixel_values)
-    entropy = -sum((count / total_pixels) * np.log2(count / total_pixels) for count in frequency.values())
-    return round(entropy, 4)
+    # Vectorized histogram with the same rounding as image.convert("L")
+    hist, _ = luma_histogram(image if image.mode == 'RGB' else image.convert('RGB'))
+    return entropy_from_histogram(hist)
+
+def entropy_from_histogram(histogram):
+    counts = np.asarray(histogram, dtype=np.float64)
+    counts = counts[counts > 0]
+    probabilities = counts / counts.sum()
+    entropy = -np.sum(probabilities * np.log2(probabilities))
+    return round(float(entropy), 4)
 
 def get_file_size_kb(path):
     return round(os.path.getsize(path) / 1024, 2)
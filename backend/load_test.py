@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Local load generator for the Flask API.
+
+    python load_test.py --workers 4 --threads 2 --concurrency 16 --duration 60
+    python load_test.py --rps 20 --mix 512x512:6,2048x2048:1 --output run.json
+    python load_test.py --url http://127.0.0.1:5500 --server-pid 1234 --baseline run.json
+
+Starts gunicorn on a free port (unless --url is given), replays a weighted mix
+of /encrypt, /decrypt and /download requests over synthetic images, and writes
+p50/p95/p99 latency, throughput, error rate and server RSS to a JSON file.
+--baseline compares the run against an earlier result file.
+
+The same images and containers are replayed throughout, so against the content
+store nearly every request would be a stored hit. The server is started with
+CONTENT_STORE=0 (and --url refuses a server with the store on) unless
+--content-store asks to measure the store deliberately.
+"""
+import argparse
+import base64
+import http.client
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.path.join(BACKEND_DIR, '..', 'uploads')
+UPLOAD_PREFIX = 'lt_'
+PIN = "LoadTest#2024"
+DEFAULT_MIX = "256x256:4,1024x1024:3,2048x2048:1"
+DEFAULT_OPS = "encrypt:4,decrypt:4,download:2"
+PREPARED_PER_SIZE = 4
+
+
+def parse_weights(spec):
+    """'a:3,b:1' -> [('a', 3), ('b', 1)]"""
+    weights = []
+    for part in spec.split(','):
+        name, _, weight = part.partition(':')
+        weights.append((name.strip(), int(weight or 1)))
+    return weights
+
+
+def synthetic_image(width, height, fmt, rng):
+    # Smooth gradient plus noise compresses like a photo rather than like pure noise
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Client:
+    """One keep-alive connection per thread"""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        for attempt in (0, 1):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                self._local.conn = None
+                # Server closed an idle keep-alive connection; retry once on a fresh one
+                stale = isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError))
+                if attempt or not stale:
+                    raise
+
+    def encrypt(self, image, filename):
+        body, content_type = multipart({'pin': PIN}, {'image': (filename, image)})
+        return self.request('POST', '/encrypt', body, {'Content-Type': content_type})
+
+    def decrypt(self, container, filename):
+        body, content_type = multipart({'pin': PIN}, {'encrypted_file': (filename, container)})
+        return self.request('POST', '/decrypt', body, {'Content-Type': content_type})
+
+
+def process_tree_rss(pid):
+    """Total VmRSS in bytes of pid and all its descendants (Linux /proc)"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Field 4 is the parent pid; the command name in parentheses may contain spaces
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+        stack.extend(children.get(current, []))
+    return total
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append(process_tree_rss(self.pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        if not self.samples:
+            return None
+        return {
+            'peak_mb': round(max(self.samples) / (1024 * 1024), 1),
+            'mean_mb': round(sum(self.samples) / len(self.samples) / (1024 * 1024), 1),
+            'final_mb': round(self.samples[-1] / (1024 * 1024), 1),
+        }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args):
+    port = free_port()
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+           '--workers', str(args.workers), '--threads', str(args.threads), '--timeout', str(int(args.timeout))]
+    log = open(args.server_log, 'ab')
+    env = dict(os.environ, CONTENT_STORE='1' if args.content_store else '0')
+    server = subprocess.Popen(cmd, cwd=BACKEND_DIR, stdout=log, stderr=log, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    client = Client(base_url, timeout=2)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited during startup (see {args.server_log})")
+        try:
+            if client.request('GET', '/metrics')[0] == 200:
+                return server, base_url
+        except (http.client.HTTPException, OSError):
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Server did not become ready within 60s")
+
+
+def check_content_store(base_url):
+    """Refuse a server that would answer the replayed inputs from its content store"""
+    status, body = Client(base_url, timeout=10).request('GET', '/metrics')
+    if status == 200 and json.loads(body).get('content_store') is not None:
+        raise RuntimeError("Server has the content store enabled, so repeated inputs are cache hits; "
+                           "restart it with CONTENT_STORE=0 or pass --content-store")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(results, elapsed):
+    """results: list of (op, size, status, seconds, ok)"""
+    def stats(rows):
+        latencies = sorted(row[3] for row in rows)
+        errors = sum(1 for row in rows if not row[4])
+        return {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': round(errors / len(rows), 4) if rows else 0.0,
+            'throughput_rps': round(len(rows) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+            'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+            'status_codes': {str(code): sum(1 for row in rows if row[2] == code)
+                             for code in sorted({row[2] for row in rows})},
+        }
+
+    summary = {'overall': stats(results), 'by_op': {}, 'by_size': {}}
+    for op in sorted({row[0] for row in results}):
+        summary['by_op'][op] = stats([row for row in results if row[0] == op])
+    for size in sorted({row[1] for row in results}):
+        summary['by_size'][size] = stats([row for row in results if row[1] == size])
+    return summary
+
+
+def prepare(client, images):
+    """Encrypt a few images per size up front so decrypt/download have containers to use"""
+    containers = {}
+    for size, image in images.items():
+        for _ in range(PREPARED_PER_SIZE):
+            status, body = client.encrypt(image, f"{UPLOAD_PREFIX}{uuid.uuid4().hex}.png")
+            if status != 200:
+                raise RuntimeError(f"Warmup encryption failed for {size}: HTTP {status} {body[:200]!r}")
+            result = json.loads(body)
+            containers.setdefault(size, []).append(
+                (base64.b64decode(result['encrypted_data']), result['encrypted_filename']))
+    return containers
+
+
+def run_load(args, base_url):
+    rng = np.random.default_rng(args.seed)
+    picker = random.Random(args.seed)
+    sizes = parse_weights(args.mix)
+    ops = parse_weights(args.ops)
+    images = {}
+    for size, _ in sizes:
+        width, height = (int(v) for v in size.lower().split('x'))
+        images[size] = synthetic_image(width, height, args.format, rng)
+
+    client = Client(base_url, timeout=args.timeout)
+    containers = prepare(client, images)
+    extension = 'jpg' if args.format == 'JPEG' else args.format.lower()
+
+    def one_request(scheduled_at=None):
+        # Open loop passes the time the request was due (perf_counter clock), so time spent
+        # waiting for a free client thread counts as latency instead of being omitted
+        size = picker.choices([s for s, _ in sizes], weights=[w for _, w in sizes])[0]
+        op = picker.choices([o for o, _ in ops], weights=[w for _, w in ops])[0]
+        container, encrypted_filename = picker.choice(containers[size])
+        started = time.perf_counter() if scheduled_at is None else scheduled_at
+        try:
+            # Unique upload names: the server stages uploads under their (secured) filename
+            if op == 'encrypt':
+                status, _ = client.encrypt(images[size], f"{UPLOAD_PREFIX}{uuid.uuid4().hex}.{extension}")
+            elif op == 'decrypt':
+                status, _ = client.decrypt(container, f"{UPLOAD_PREFIX}{uuid.uuid4().hex}.enc")
+            else:
+                status, _ = client.request('GET', f'/download/{encrypted_filename}')
+        except (http.client.HTTPException, OSError):
+            status = 0
+        return (op, size, status, time.perf_counter() - started, status == 200)
+
+    results = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def record(result):
+        with lock:
+            results.append(result)
+
+    started = time.monotonic()
+    if args.rps:
+        # Open loop: requests are issued on a fixed schedule whether or not earlier ones finished
+        interval = 1.0 / args.rps
+        end_at = time.perf_counter() + (deadline - time.monotonic())
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            next_at = time.perf_counter()
+            while next_at < end_at:
+                time.sleep(max(0.0, next_at - time.perf_counter()))
+                pool.submit(one_request, next_at).add_done_callback(lambda f: record(f.result()))
+                next_at += interval
+    else:
+        # Closed loop: each of `concurrency` users sends its next request when the last returns
+        def user():
+            while time.monotonic() < deadline:
+                record(one_request())
+        threads = [threading.Thread(target=user) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return results, time.monotonic() - started
+
+
+def compare(current, baseline):
+    lines = [f"{'metric':<28} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for op, stats in current['summary']['by_op'].items():
+        before = baseline['summary']['by_op'].get(op)
+        if not before:
+            continue
+        for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate'):
+            old, new = before.get(key), stats.get(key)
+            change = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else "n/a"
+            lines.append(f"{op + '.' + key:<28} {old!s:>10} {new!s:>10} {change:>8}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the encrypt/decrypt/download API")
+    parser.add_argument('--url', default=None, help="Target a running server instead of starting gunicorn")
+    parser.add_argument('--server-pid', type=int, default=None, help="Server pid for RSS sampling with --url")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers")
+    parser.add_argument('--threads', type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients (closed loop) or max in flight")
+    parser.add_argument('--rps', type=float, default=None, help="Target request rate (open loop)")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of measured load")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Weighted image sizes, e.g. 512x512:3,4096x4096:1")
+    parser.add_argument('--ops', default=DEFAULT_OPS, help="Weighted operations (encrypt, decrypt, download)")
+    parser.add_argument('--format', default='PNG', choices=['PNG', 'JPEG'], help="Synthetic upload format")
+    parser.add_argument('--timeout', type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--content-store', action='store_true',
+                        help="Keep the content store on (repeated inputs are then mostly store hits)")
+    parser.add_argument('--server-log', default=os.devnull, help="Where gunicorn output goes")
+    parser.add_argument('--output', default='load_test_results.json')
+    parser.add_argument('--baseline', default=None, help="Earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        base_url, server_pid = args.url.rstrip('/'), args.server_pid
+        if not args.content_store:
+            check_content_store(base_url)
+    else:
+        server, base_url = start_server(args)
+        server_pid = server.pid
+
+    sampler = RssSampler(server_pid) if server_pid and os.path.isdir('/proc') else None
+    try:
+        if sampler:
+            sampler.start()
+        results, elapsed = run_load(args, base_url)
+    finally:
+        rss = sampler.stop() if sampler else None
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+            # Encrypted outputs stay in uploads/ for /download; remove the ones this run created
+            for name in os.listdir(UPLOAD_FOLDER):
+                if name.startswith(UPLOAD_PREFIX):
+                    os.remove(os.path.join(UPLOAD_FOLDER, name))
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'server_log')},
+        'elapsed_seconds': round(elapsed, 2),
+        'summary': summarize(results, elapsed),
+        'server_rss': rss,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    overall = report['summary']['overall']
+    print(f"✅ {overall['requests']} requests in {elapsed:.1f}s: {overall['throughput_rps']} req/s, "
+          f"p50 {overall['p50_ms']} ms, p95 {overall['p95_ms']} ms, p99 {overall['p99_ms']} ms, "
+          f"errors {overall['error_rate']:.2%}" + (f", peak RSS {rss['peak_mb']} MB" if rss else ""))
+    print(f"📄 Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            print(compare(report, json.load(f)))
+    return 1 if overall['error_rate'] > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,487 @@
+"""
+Activity log backends.
+
+LOG_BACKEND=sqlite (default) stores events in an SQLite database in WAL mode, so
+every gunicorn worker can append while others read. Inserts are buffered and
+written in batches. LOG_BACKEND=csv keeps the original logs/activity_log.csv file.
+
+The first time the SQLite store opens it imports the existing CSV once; the CSV
+file is left in place, so switching back to the CSV backend keeps the old history.
+
+Retention (`python log_store.py archive`) moves entries older than
+LOG_RETENTION_DAYS into compressed CSV segments under logs/archive, named by the
+time range they cover. Exports stream the archives first and then the live log.
+"""
+import argparse
+import atexit
+import csv
+import glob
+import gzip
+import io
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows (desktop GUI): a single process, nothing to coordinate
+    fcntl = None
+
+LOG_DIR = "logs"
+CSV_PATH = os.path.join(LOG_DIR, "activity_log.csv")
+DEFAULT_DB_PATH = os.path.join(LOG_DIR, "activity_log.db")
+LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', '50'))
+LOG_FLUSH_SECONDS = float(os.getenv('LOG_FLUSH_SECONDS', '1'))
+CSV_HEADER = ["Timestamp", "Event"]
+EVENT_TYPE_MAX_LEN = 64
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+ARCHIVE_DIR = os.path.join(LOG_DIR, "archive")
+ARCHIVE_EXTENSIONS = {'gzip': '.csv.gz', 'zstd': '.csv.zst'}
+LOG_RETENTION_DAYS = float(os.getenv('LOG_RETENTION_DAYS', '30'))
+LOG_ARCHIVE_COMPRESSION = os.getenv('LOG_ARCHIVE_COMPRESSION', 'gzip')
+# Rows fetched per round trip when streaming from SQLite
+FETCH_ROWS = 1000
+EXPORT_CHUNK_CHARS = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events (timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_type ON events (event_type);
+CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY, applied_at TEXT NOT NULL);
+"""
+
+
+@contextmanager
+def _file_lock(path, blocking=True):
+    """Exclusive flock on path across processes. Yields False if blocking=False and it is busy."""
+    if fcntl is None:
+        yield True
+        return
+    with open(path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+def _counted(rows, counter):
+    for row in rows:
+        counter[0] += 1
+        yield row
+
+
+def event_type_of(event):
+    """Derive a coarse type from a free-form message: the text before ':' (e.g. 'web encryption completed')"""
+    head = event.split(':', 1)[0].strip().lower().rstrip('.')
+    return head[:EVENT_TYPE_MAX_LEN]
+
+
+class CsvLogStore:
+    def __init__(self, path=CSV_PATH):
+        self.path = path
+
+    def append(self, timestamp, event):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # archive() holds this lock while it swaps in the rewritten live file
+        with _file_lock(self.path + ".lock"):
+            file_exists = os.path.isfile(self.path)
+            with open(self.path, "a", newline='') as log_file:
+                writer = csv.writer(log_file)
+                if not file_exists:
+                    writer.writerow(CSV_HEADER)
+                writer.writerow([timestamp, event])
+
+    def flush(self):
+        pass
+
+    def iter_rows(self, event_type=None, since=None):
+        """Yield [timestamp, event] rows oldest first, one line at a time"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", newline='') as f:
+            yield from _filter_rows(csv.reader(f), event_type, since)
+
+    def read(self, limit=None, event_type=None, since=None):
+        """Return [timestamp, event] rows, oldest first (the last `limit` rows if given)"""
+        return list(deque(self.iter_rows(event_type, since), maxlen=limit))
+
+    def archive(self, before, archive_dir=ARCHIVE_DIR, compression=LOG_ARCHIVE_COMPRESSION):
+        """
+        Move the leading entries older than `before` into an archive segment; newer
+        ones stay in the live file. The segment is compressed while appends carry on
+        (the file only grows); only the rewrite of the live file blocks them.
+        """
+        with _file_lock(self.path + ".archive.lock", blocking=False) as acquired:
+            if not acquired:
+                return None  # Another worker is archiving
+            archived = [0]
+            older = itertools.takewhile(lambda row: row[0] < before, self.iter_rows())
+            path = write_archive(_counted(older, archived), archive_dir, compression)
+            if path is None:
+                return None
+            rewriting = self.path + f".rotating-{os.getpid()}"
+            try:
+                with _file_lock(self.path + ".lock"):
+                    with open(self.path, "r", newline='') as src, open(rewriting, "w", newline='') as dst:
+                        writer = csv.writer(dst)
+                        writer.writerow(CSV_HEADER)
+                        writer.writerows(itertools.islice(_filter_rows(csv.reader(src)), archived[0], None))
+                    os.replace(rewriting, self.path)
+            except BaseException:
+                os.remove(path)
+                if os.path.exists(rewriting):
+                    os.remove(rewriting)
+                raise
+            return path
+
+
+class SqliteLogStore:
+    """
+    WAL-mode SQLite log. Connections are per thread; appends are buffered and
+    flushed when LOG_BATCH_SIZE is reached, every LOG_FLUSH_SECONDS, and at exit.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, csv_path=CSV_PATH, batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_SECONDS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        if csv_path:
+            self.migrate_csv(csv_path)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def migrate_csv(self, csv_path):
+        """Import an existing CSV log once. Safe to call from several workers at the same time."""
+        if not os.path.exists(csv_path):
+            return 0
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front, so only one worker performs the import
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM migrations WHERE name = 'csv_import'").fetchone():
+                conn.execute("ROLLBACK")
+                return 0
+            rows = CsvLogStore(csv_path).read()
+            conn.executemany("INSERT INTO events (timestamp, event_type, event) VALUES (?, ?, ?)",
+                             ((timestamp, event_type_of(event), event) for timestamp, event in rows))
+            conn.execute("INSERT INTO migrations (name, applied_at) VALUES ('csv_import', datetime('now'))")
+            conn.execute("COMMIT")
+            return len(rows)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def append(self, timestamp, event):
+        with self._lock:
+            self._pending.append((timestamp, event_type_of(event), event))
+            full = len(self._pending) >= self.batch_size
+            if self._flusher is None and self.flush_interval > 0:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+        if full or self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT INTO events (timestamp, event_type, event) VALUES (?, ?, ?)", pending)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"❌ Log flush failed, will retry: {e}", file=sys.stderr, flush=True)
+            with self._lock:
+                self._pending[:0] = pending
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _where(self, event_type, since):
+        clauses, params = [], []
+        if event_type:
+            clauses.append("event_type = ?")
+            params.append(event_type)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def iter_rows(self, event_type=None, since=None):
+        """Yield [timestamp, event] rows oldest first, FETCH_ROWS at a time"""
+        self.flush()
+        where, params = self._where(event_type, since)
+        # A dedicated connection keeps the read snapshot independent of writes on this thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            cursor = conn.execute(f"SELECT timestamp, event FROM events {where} ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                for row in rows:
+                    yield list(row)
+        finally:
+            conn.close()
+
+    def archive(self, before, archive_dir=ARCHIVE_DIR, compression=LOG_ARCHIVE_COMPRESSION):
+        """
+        Move entries older than `before` into one archive segment. Returns its path or None.
+        The segment is written outside any transaction, so appends are not blocked while
+        it compresses; only the delete takes the write lock.
+        """
+        self.flush()
+        conn = self._connection()
+        max_id = conn.execute("SELECT MAX(id) FROM events WHERE timestamp < ?", (before,)).fetchone()[0]
+        if max_id is None:
+            return None
+        archived = [0]
+        reader = sqlite3.connect(self.path, timeout=30)
+        try:
+            cursor = reader.execute("SELECT timestamp, event FROM events WHERE id <= ? ORDER BY id", (max_id,))
+            path = write_archive(_counted(_iter_cursor(cursor), archived), archive_dir, compression)
+        finally:
+            reader.close()
+        if path is None:
+            return None
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker archiving at the same time deletes (some of) these rows first; its segment wins
+            remaining = conn.execute("SELECT COUNT(*) FROM events WHERE id <= ?", (max_id,)).fetchone()[0]
+            if remaining != archived[0]:
+                conn.execute("ROLLBACK")
+                os.remove(path)
+                return None
+            conn.execute("DELETE FROM events WHERE id <= ?", (max_id,))
+            conn.execute("COMMIT")
+            return path
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            os.remove(path)
+            raise
+
+    def read(self, limit=None, event_type=None, since=None):
+        """Return [timestamp, event] rows, oldest first (the last `limit` rows if given)"""
+        self.flush()
+        where, params = self._where(event_type, since)
+        query = f"SELECT timestamp, event FROM events {where} ORDER BY id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self._connection().execute(query, params).fetchall()
+        return [list(row) for row in reversed(rows)]
+
+
+def _iter_cursor(cursor):
+    while True:
+        rows = cursor.fetchmany(FETCH_ROWS)
+        if not rows:
+            return
+        for row in rows:
+            yield list(row)
+
+
+def _filter_rows(rows, event_type=None, since=None):
+    for row in rows:
+        if len(row) < 2 or row[:2] == CSV_HEADER:
+            continue
+        if event_type and event_type_of(row[1]) != event_type:
+            continue
+        if since and row[0] < since:
+            continue
+        yield row[:2]
+
+
+def _compact(timestamp):
+    return timestamp.replace('-', '').replace(':', '').replace(' ', 'T')
+
+
+def _open_text(path, mode, compression):
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd archives need the 'zstandard' package")
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+
+
+def write_archive(rows, archive_dir=ARCHIVE_DIR, compression=LOG_ARCHIVE_COMPRESSION):
+    """
+    Stream rows into a compressed CSV segment named activity_log-<first>-<last><ext>,
+    so names sort chronologically. Returns the path, or None if rows was empty.
+    """
+    if compression not in ARCHIVE_EXTENSIONS:
+        raise ValueError(f"Unsupported archive compression: {compression}")
+    os.makedirs(archive_dir, exist_ok=True)
+    tmp_path = os.path.join(archive_dir, f".segment-{os.getpid()}.tmp")
+    first = last = None
+    with _open_text(tmp_path, 'w', compression) as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for row in rows:
+            first = first or row[0]
+            last = row[0]
+            writer.writerow(row)
+    if first is None:
+        os.remove(tmp_path)
+        return None
+    stem = os.path.join(archive_dir, f"activity_log-{_compact(first)}-{_compact(last)}")
+    path = stem + ARCHIVE_EXTENSIONS[compression]
+    counter = 1
+    while os.path.exists(path):
+        path = f"{stem}.{counter}{ARCHIVE_EXTENSIONS[compression]}"
+        counter += 1
+    os.replace(tmp_path, path)
+    return path
+
+
+def list_archives(archive_dir=ARCHIVE_DIR):
+    return sorted(path for ext in ARCHIVE_EXTENSIONS.values()
+                  for path in glob.glob(os.path.join(archive_dir, f"activity_log-*{ext}")))
+
+
+def iter_archive_rows(path, event_type=None, since=None):
+    compression = 'zstd' if path.endswith(ARCHIVE_EXTENSIONS['zstd']) else 'gzip'
+    with _open_text(path, 'r', compression) as f:
+        yield from _filter_rows(csv.reader(f), event_type, since)
+
+
+def iter_export_rows(store, event_type=None, since=None, include_archives=True, archive_dir=ARCHIVE_DIR):
+    """Yield every matching row, archived segments first, without materialising any of them"""
+    if include_archives:
+        for path in list_archives(archive_dir):
+            # Segment names end with their last timestamp, so old segments are skipped unopened
+            last = os.path.basename(path).split('.')[0].rsplit('-', 1)[-1]
+            if since and last < _compact(since):
+                continue
+            yield from iter_archive_rows(path, event_type, since)
+    yield from store.iter_rows(event_type, since)
+
+
+def _batched(lines):
+    # Join small lines into ~64 KB chunks so the response isn't one write per row
+    batch, size = [], 0
+    for line in lines:
+        batch.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_CHARS:
+            yield ''.join(batch)
+            batch, size = [], 0
+    if batch:
+        yield ''.join(batch)
+
+
+def export_ndjson(rows):
+    return _batched(json.dumps({'timestamp': timestamp, 'event': event}) + "\n" for timestamp, event in rows)
+
+
+def export_csv(rows):
+    def lines():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_HEADER)
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    return _batched(lines())
+
+
+def apply_retention(days=LOG_RETENTION_DAYS, compression=LOG_ARCHIVE_COMPRESSION, archive_dir=ARCHIVE_DIR):
+    """Archive live entries older than `days`. Returns the new segment path or None."""
+    before = (datetime.now() - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+    return get_log_store().archive(before, archive_dir, compression)
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_log_store():
+    """
+    Process-wide log store for the configured backend (re-created after a fork).
+    LOG_BACKEND / LOG_DB_PATH are read on first use, so a later load_dotenv() still applies.
+    """
+    global _store, _store_pid
+    with _store_lock:
+        if _store is None or _store_pid != os.getpid():
+            if os.getenv('LOG_BACKEND', 'sqlite') == 'csv':
+                _store = CsvLogStore()
+            else:
+                _store = SqliteLogStore(os.getenv('LOG_DB_PATH', DEFAULT_DB_PATH))
+            _store_pid = os.getpid()
+        return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Activity log maintenance")
+    sub = parser.add_subparsers(dest='command', required=True)
+    archive = sub.add_parser('archive', help="Move old entries into a compressed archive segment")
+    archive.add_argument('--days', type=float, default=LOG_RETENTION_DAYS)
+    archive.add_argument('--compression', choices=sorted(ARCHIVE_EXTENSIONS), default=LOG_ARCHIVE_COMPRESSION)
+    export = sub.add_parser('export', help="Stream archived and live entries to stdout")
+    export.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    export.add_argument('--type', default=None, help="Only this event type")
+    export.add_argument('--since', default=None, help="Only entries at or after 'YYYY-MM-DD HH:MM:SS'")
+    args = parser.parse_args(argv)
+
+    if args.command == 'archive':
+        path = apply_retention(args.days, args.compression)
+        print(f"✅ Archived to {path}" if path else "Nothing to archive")
+    else:
+        rows = iter_export_rows(get_log_store(), args.type, args.since)
+        for chunk in (export_csv(rows) if args.format == 'csv' else export_ndjson(rows)):
+            sys.stdout.write(chunk)
+
+
+if __name__ == '__main__':
+    main()
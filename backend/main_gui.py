@@ -1,40 +1,140 @@
 import tkinter as tk
-from tkinter import messagebox, filedialog
+from tkinter import messagebox, filedialog, ttk
 from tkinter.font import Font
-from encryption import encrypt_image
-from decryption import decrypt_image
+from PIL import Image
+from encryption import encrypt_image, show_encryption_chart
+from decryption import decrypt_image, show_decryption_chart
+from gui_worker import BackgroundWorker
 from key_utils import check_pin_strength
+from log_store import CSV_HEADER, get_log_store
 from dotenv import load_dotenv
 import os
-import csv
 
 # Load credentials from .env file
 load_dotenv()
 
-# Global file paths
-image_path = ""
-encrypted_file_path = ""
+# Global file paths (multiple files can be selected and queued)
+image_paths = []
+encrypted_file_paths = []
+
+# Encryption/decryption runs on a background thread; the Tk thread only polls its events
+worker = BackgroundWorker()
+POLL_INTERVAL_MS = 100
+batch = {'total': 0, 'finished': 0, 'failed': 0, 'cancelled': 0, 'results': []}
 
 def update_strength_label(event):
     pin = entry_pin_encrypt.get()
     strength = check_pin_strength(pin)
     label_strength.config(text=f"PIN Strength: {strength}", fg=("green" if strength == "Strong" else "orange" if strength == "Medium" else "red"))
 
+def describe_selection(paths):
+    if len(paths) == 1:
+        return os.path.basename(paths[0])
+    return f"{len(paths)} files selected"
+
 def browse_image():
-    global image_path
+    global image_paths
     filetypes = (("Image files", "*.jpg *.jpeg *.png"), ("All files", "*.*"))
-    filename = filedialog.askopenfilename(title="Select Image", filetypes=filetypes)
-    if filename:
-        image_path = filename
-        label_file.config(text=filename.split('/')[-1])
+    filenames = filedialog.askopenfilenames(title="Select Images", filetypes=filetypes)
+    if filenames:
+        image_paths = list(filenames)
+        label_file.config(text=describe_selection(image_paths))
 
 def browse_encrypted_file():
-    global encrypted_file_path
+    global encrypted_file_paths
     filetypes = (("Encrypted files", "*.enc"), ("All files", "*.*"))
-    filename = filedialog.askopenfilename(title="Select Encrypted File", filetypes=filetypes)
-    if filename:
-        encrypted_file_path = filename
-        label_encrypted_file.config(text=filename.split('/')[-1])
+    filenames = filedialog.askopenfilenames(title="Select Encrypted Files", filetypes=filetypes)
+    if filenames:
+        encrypted_file_paths = list(filenames)
+        label_encrypted_file.config(text=describe_selection(encrypted_file_paths))
+
+def queue_jobs(kind, func, paths, pin):
+    output_dir = filedialog.askdirectory(title=f"Select folder for {kind} files")
+    if not output_dir:
+        return
+    if batch['finished'] == batch['total']:
+        # Previous batch is complete; start counting afresh
+        batch.update({'total': 0, 'finished': 0, 'failed': 0, 'cancelled': 0, 'results': []})
+    for path in paths:
+        worker.submit((kind, path), func, path, pin, output_dir)
+    batch['total'] += len(paths)
+    btn_cancel.config(state=tk.NORMAL)
+    update_progress(None, 0.0)
+
+def start_encryption():
+    if not image_paths:
+        messagebox.showwarning("Warning", "No image selected!")
+        return
+    pin = entry_pin_encrypt.get()
+    if not pin:
+        messagebox.showwarning("Warning", "Enter a PIN for encryption!")
+        return
+    queue_jobs("encrypted", encrypt_image, image_paths, pin)
+
+def start_decryption():
+    if not encrypted_file_paths:
+        messagebox.showwarning("Warning", "No encrypted file selected!")
+        return
+    pin = entry_pin_decrypt.get()
+    if not pin:
+        messagebox.showwarning("Warning", "Enter the correct PIN to decrypt!")
+        return
+    queue_jobs("decrypted", decrypt_image, encrypted_file_paths, pin)
+
+def cancel_jobs():
+    worker.cancel()
+    label_progress.config(text="Cancelling...")
+
+def update_progress(label, fraction, stage=""):
+    total = max(batch['total'], 1)
+    progress_bar['value'] = 100 * (batch['finished'] + fraction) / total
+    if label is not None:
+        index = min(batch['finished'] + 1, batch['total'])
+        label_progress.config(text=f"File {index}/{batch['total']}: {os.path.basename(label[1])} - {stage}")
+
+def finish_batch():
+    btn_cancel.config(state=tk.DISABLED)
+    progress_bar['value'] = 100 if batch['total'] else 0
+    done = len(batch['results'])
+    label_progress.config(text=f"Done: {done} succeeded, {batch['failed']} failed, {batch['cancelled']} cancelled")
+
+    mismatches = [stats for kind, stats in batch['results'] if stats.get('integrity_verified') is False]
+    if mismatches:
+        names = "\n".join(os.path.basename(stats['save_path']) for stats in mismatches)
+        messagebox.showwarning("Integrity Alert", f"Hash mismatch detected! Files may be tampered with:\n{names}")
+
+    if done == 1 and batch['total'] == 1:
+        # Single file: show the stats charts (and a preview after decrypting), like before
+        kind, stats = batch['results'][0]
+        if kind == "encrypted":
+            messagebox.showinfo("Original Image Stats", f"Entropy: {stats['entropy_before']}\nSize: {stats['size_before']} KB")
+            show_encryption_chart(main, stats)
+            messagebox.showinfo("Success", "Image Encrypted and Saved!")
+        else:
+            Image.open(stats['save_path']).show()
+            messagebox.showinfo("Success", f"Image decrypted and saved to: {stats['save_path']}\nEncrypted file deleted.")
+            show_decryption_chart(main, stats)
+    elif done:
+        messagebox.showinfo("Success", f"{done} of {batch['total']} files processed.")
+
+def poll_worker():
+    for kind, label, payload in worker.poll():
+        if kind == 'progress':
+            stage, fraction = payload
+            update_progress(label, fraction, stage)
+            continue
+        batch['finished'] += 1
+        if kind == 'done':
+            batch['results'].append((label[0], payload))
+        elif kind == 'error':
+            batch['failed'] += 1
+            messagebox.showerror("Error", f"{os.path.basename(label[1])} failed: {str(payload) or type(payload).__name__}")
+        else:
+            batch['cancelled'] += 1
+        update_progress(None, 0.0)
+        if batch['finished'] == batch['total']:
+            finish_batch()
+    main.after(POLL_INTERVAL_MS, poll_worker)
 
 def authenticate_and_open_log():
     auth_window = tk.Toplevel(main)
@@ -64,8 +164,8 @@ def authenticate_and_open_log():
     tk.Button(auth_window, text="Login", bg="gray", command=check_credentials).pack(pady=10)
 
 def show_log_csv():
-    log_path = os.path.join("logs", "activity_log.csv")
-    if not os.path.exists(log_path):
+    rows = get_log_store().read()
+    if not rows:
         messagebox.showinfo("Log Viewer", "Log file is empty or missing.")
         return
 
@@ -76,25 +176,23 @@ def show_log_csv():
     text_widget = tk.Text(log_window, wrap="none")
     text_widget.pack(expand=True, fill='both')
 
-    with open(log_path, "r") as f:
-        reader = csv.reader(f)
-        for row in reader:
-            text_widget.insert(tk.END, ', '.join(row) + "\n")
+    for row in [CSV_HEADER] + rows:
+        text_widget.insert(tk.END, ', '.join(row) + "\n")
 
 # GUI Setup
 main = tk.Tk()
 main.title("Image Encrypt Decrypt")
-main.geometry("450x550")
+main.geometry("450x650")
 main.configure(background='#dfdddd')
 main.bold_font = Font(family="Helvetica", size=14, weight="bold")
 
 label_title = tk.Label(main, text="Image Encryption & Decryption", font=main.bold_font, bg='#dfdddd')
 label_title.pack(pady=10)
 
-label_file = tk.Label(main, text="No original image selected", bg='#dfdddd')
+label_file = tk.Label(main, text="No original images selected", bg='#dfdddd')
 label_file.pack()
 
-btn_browse = tk.Button(main, text="Browse Original Image", command=browse_image, bg='#e28743')
+btn_browse = tk.Button(main, text="Browse Original Images", command=browse_image, bg='#e28743')
 btn_browse.pack(pady=5)
 
 label_pin = tk.Label(main, text="Enter Encryption PIN:", bg='#dfdddd')
@@ -107,13 +205,13 @@ entry_pin_encrypt.bind("<KeyRelease>", update_strength_label)
 label_strength = tk.Label(main, text="PIN Strength: ", bg='#dfdddd')
 label_strength.pack()
 
-btn_encrypt = tk.Button(main, text="Encrypt Image", bg='#e28743', command=lambda: encrypt_image(image_path, entry_pin_encrypt.get()))
+btn_encrypt = tk.Button(main, text="Encrypt Images", bg='#e28743', command=start_encryption)
 btn_encrypt.pack(pady=5)
 
-label_encrypted_file = tk.Label(main, text="No encrypted file selected", bg='#dfdddd')
+label_encrypted_file = tk.Label(main, text="No encrypted files selected", bg='#dfdddd')
 label_encrypted_file.pack()
 
-btn_browse_enc = tk.Button(main, text="Browse Encrypted File", command=browse_encrypted_file, bg='#e28743')
+btn_browse_enc = tk.Button(main, text="Browse Encrypted Files", command=browse_encrypted_file, bg='#e28743')
 btn_browse_enc.pack(pady=5)
 
 label_pin_decrypt = tk.Label(main, text="Enter Decryption PIN:", bg='#dfdddd')
@@ -122,10 +220,20 @@ label_pin_decrypt.pack()
 entry_pin_decrypt = tk.Entry(main, show='*')
 entry_pin_decrypt.pack(pady=5)
 
-btn_decrypt = tk.Button(main, text="Decrypt Image", bg='#e28743', command=lambda: decrypt_image(encrypted_file_path, entry_pin_decrypt.get()))
+btn_decrypt = tk.Button(main, text="Decrypt Images", bg='#e28743', command=start_decryption)
 btn_decrypt.pack(pady=5)
 
+progress_bar = ttk.Progressbar(main, orient="horizontal", length=350, mode="determinate", maximum=100)
+progress_bar.pack(pady=(15, 5))
+
+label_progress = tk.Label(main, text="Idle", bg='#dfdddd')
+label_progress.pack()
+
+btn_cancel = tk.Button(main, text="Cancel", bg='gray', command=cancel_jobs, state=tk.DISABLED)
+btn_cancel.pack(pady=5)
+
 btn_log = tk.Button(main, text="View Activity Log", bg='gray', command=authenticate_and_open_log)
 btn_log.pack(pady=15)
 
+main.after(POLL_INTERVAL_MS, poll_worker)
 main.mainloop()
@@ -0,0 +1,341 @@
+"""
+Streaming multipart/form-data uploads.
+
+request.files makes Werkzeug spool the whole body before the handler runs, and
+file.save() then copies it again. parse_form() instead reads the request stream
+in blocks through Werkzeug's sans-IO MultipartDecoder. Text fields are collected;
+each file part is written to its staging path as it arrives, hashed (SHA-256,
+reused as the content store key) and size-checked, and handed to a feed:
+
+    ImageFeed      decodes a PNG or JPEG while it uploads
+    ContainerFeed  authenticates and decrypts a single-frame container while it
+                   uploads (needs the PIN field to arrive before the file)
+
+Feeds only ever speed things up: whenever one gives up (other formats, animated
+images, multi-frame containers, bad data), the staged file is processed as before.
+"""
+import hashlib
+import io
+import os
+import struct
+from contextlib import ExitStack
+from cryptography.fernet import InvalidToken
+from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from admission import estimate_peak_bytes
+from container import MAX_HEADER_BYTES, ContainerError, atomic_output, parse_container
+from fernet_stream import TokenDecryptor, fernet_key_bytes
+
+READ_BLOCK = 64 * 1024
+MAX_FIELD_BYTES = 500 * 1024  # Per text field, and the decoder's buffer (Werkzeug's default)
+MAX_IMAGE_HEADER_BYTES = 1024 * 1024  # Give up on incremental decoding if no header by then
+STREAM_FORMATS = ('PNG', 'JPEG')
+PNG_CHUNK_FRAME = 12  # CRC of one chunk + length and type of the next
+
+
+class FormError(ValueError):
+    """Rejected upload; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class StagedPart:
+    """A file part written to `path` while it arrives; sha256 and size are final once closed"""
+
+    def __init__(self, path, feed=None):
+        self.path = path
+        self.feed = feed
+        self.filename = None
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._stack = ExitStack()
+        self._out = self._stack.enter_context(atomic_output(path))
+
+    @property
+    def sha256(self):
+        return self._hasher.hexdigest()
+
+    def write(self, data):
+        self.size += len(data)
+        self._hasher.update(data)
+        self._out.write(data)
+        if self.feed is not None:
+            self.feed.feed(data)
+
+    def close(self):
+        self._stack.close()  # Renames the staged file into place
+        if self.feed is not None:
+            self.feed.close()
+
+    def abort(self):
+        error = FormError('Upload aborted')
+        self._stack.__exit__(FormError, error, None)  # Removes the partial file
+
+
+def parse_form(stream, content_type, open_part, max_bytes):
+    """
+    Parse a multipart/form-data body from a binary stream as it is read.
+    open_part(name, filename, fields) returns a StagedPart for a file part, or
+    None to skip it; fields holds the text fields seen so far. Returns
+    (fields, parts by name); a repeated part name keeps the first. Raises
+    FormError; staged files are removed on any error.
+    """
+    mimetype, options = parse_options_header(content_type)
+    if mimetype != 'multipart/form-data' or not options.get('boundary'):
+        raise FormError('Expected a multipart/form-data request')
+    decoder = MultipartDecoder(options['boundary'].encode(), max_form_memory_size=MAX_FIELD_BYTES)
+
+    fields, parts = {}, {}
+    field_name, field_data, part = None, None, None
+    received = 0
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                data = stream.read(READ_BLOCK)
+                received += len(data)
+                if received > max_bytes:
+                    raise FormError('File too large', 413)
+                decoder.receive_data(data or None)
+            elif isinstance(event, Field):
+                field_name, field_data, part = event.name, [], None
+            elif isinstance(event, File):
+                field_name, field_data = None, None
+                part = open_part(event.name, event.filename, fields) if event.name not in parts else None
+                if part is not None:
+                    part.filename = event.filename
+                    parts[event.name] = part
+            elif isinstance(event, Data):
+                if field_data is not None:
+                    field_data.append(event.data)
+                    if sum(map(len, field_data)) > MAX_FIELD_BYTES:
+                        raise FormError('Form field too large', 413)
+                elif part is not None:
+                    part.write(event.data)
+                if not event.more_data:
+                    if field_data is not None:
+                        fields.setdefault(field_name, b''.join(field_data).decode('utf-8', 'replace'))
+                    elif part is not None:
+                        part.close()
+                    field_name, field_data, part = None, None, None
+            elif isinstance(event, Epilogue):
+                return fields, parts
+    except RequestEntityTooLarge:
+        _discard(parts, part)
+        raise FormError('File too large', 413)
+    except ValueError as e:
+        _discard(parts, part)
+        if isinstance(e, FormError):
+            raise
+        raise FormError(f'Malformed upload: {e}')
+    except BaseException:
+        _discard(parts, part)
+        raise
+
+
+def _discard(parts, open_part):
+    if open_part is not None:
+        open_part.abort()
+    for staged in parts.values():
+        if staged is not open_part and os.path.exists(staged.path):
+            os.remove(staged.path)
+
+
+class ImageFeed:
+    """
+    Decode an image while it uploads. Works like PIL.ImageFile.Parser, which for
+    PNG and JPEG just buffers everything until close(): here PNG IDAT payloads
+    (chunk framing stripped) and JPEG data go straight to Pillow's decoder.
+    With an AdmissionController the request is admitted as soon as the header
+    has arrived; release() gives the budget back. image is None unless decoding
+    completed, and then the budget is already released: the staged file is
+    processed (and admitted) again, and holding both could wait on itself.
+    """
+
+    def __init__(self, admission=None, operation='encrypt'):
+        self.admission = admission
+        self.operation = operation
+        self.admitted_cost = 0
+        self.image = None
+        self._opened = None
+        self._buffer = bytearray()
+        self._decoder = None
+        self._pending = b''
+        self._finished = False
+        self._active = True
+        self._png = False
+        self._chunk_left = 0
+        self._frame = b''
+
+    def feed(self, data):
+        if not self._active:
+            return
+        if self._decoder is None:
+            self._buffer += data
+            self._start()
+        elif self._png:
+            self._feed_png(data)
+        else:
+            self._decode(data)
+
+    def _start(self):
+        try:
+            with io.BytesIO(bytes(self._buffer)) as fp:
+                image = Image.open(fp)
+        except (OSError, SyntaxError, ValueError, struct.error, Image.DecompressionBombError):
+            if len(self._buffer) > MAX_IMAGE_HEADER_BYTES:
+                self._give_up()
+            return  # Not enough data for the header yet
+
+        if (image.format not in STREAM_FORMATS or getattr(image, 'is_animated', False)
+                or image.info.get('interlace') or len(image.tile) != 1):
+            self._give_up()
+            return
+        if self.admission is not None:
+            cost = estimate_peak_bytes(image.size, image.mode, self.operation)
+            self.admission.acquire(cost)
+            self.admitted_cost = cost
+
+        image.load_prepare()
+        codec, extents, offset, args = image.tile[0]
+        image.tile = []
+        self._decoder = Image._getdecoder(image.mode, codec, args, image.decoderconfig)
+        self._decoder.setimage(image.im, extents)
+        self._opened = image
+        rest = bytes(self._buffer[offset:])
+        self._png = image.format == 'PNG'
+        if self._png:
+            # offset is the start of the first IDAT's data; its length precedes the type
+            self._chunk_left = struct.unpack('>I', self._buffer[offset - 8:offset - 4])[0]
+            self._buffer = None
+            self._feed_png(rest)
+        else:
+            self._buffer = None
+            self._decode(rest)
+
+    def _feed_png(self, data):
+        pos = 0
+        while pos < len(data) and self._active and not self._finished:
+            if self._chunk_left:
+                take = min(self._chunk_left, len(data) - pos)
+                self._decode(data[pos:pos + take])
+                self._chunk_left -= take
+                pos += take
+                continue
+            take = min(PNG_CHUNK_FRAME - len(self._frame), len(data) - pos)
+            self._frame += data[pos:pos + take]
+            pos += take
+            if len(self._frame) == PNG_CHUNK_FRAME:
+                length, chunk_type = struct.unpack('>I4s', self._frame[4:])
+                self._frame = b''
+                if chunk_type != b'IDAT':
+                    self._give_up()  # Image data ended before the decoder did
+                    return
+                self._chunk_left = length
+
+    def _decode(self, data):
+        if self._finished:
+            return
+        self._pending += data
+        consumed, error = self._decoder.decode(self._pending)
+        if consumed < 0:
+            self._finished = True
+            self._pending = b''
+            if error < 0:
+                self._give_up()
+            return
+        self._pending = self._pending[consumed:]
+
+    def _give_up(self):
+        self.release()
+        self._active = False
+        self._buffer = None
+        self._pending = b''
+        self._opened = None
+        if self._decoder is not None:
+            self._decoder.cleanup()
+            self._decoder = None
+
+    def close(self):
+        if self._active and self._decoder is not None:
+            if not self._finished:
+                self._decode(b'')  # As ImageFile.Parser.close(): flush what the decoder holds
+            if self._finished and self._active:
+                self._decoder.cleanup()
+                self.image = self._opened
+        self._decoder = None
+        self._opened = None
+        self._buffer = None
+        self._active = False
+        if self.image is None:
+            self.release()
+
+    def release(self):
+        if self.admitted_cost:
+            self.admission.release(self.admitted_cost)
+            self.admitted_cost = 0
+
+
+class ContainerFeed:
+    """
+    Authenticate and decrypt a single-frame container while it uploads. The
+    header is parsed from the first bytes, then the token goes through a
+    TokenDecryptor. plaintext is set only once the HMAC has been verified in
+    close(); otherwise (multi-frame, wrong PIN, malformed) it stays None.
+    """
+
+    def __init__(self, pin):
+        self.key = fernet_key_bytes(pin)
+        self.plaintext = None
+        self._buffer = bytearray()
+        self._decryptor = None
+        self._pieces = []
+        self._active = True
+
+    def feed(self, data):
+        if not self._active:
+            return
+        if self._decryptor is None:
+            self._buffer += data
+            if len(self._buffer) >= MAX_HEADER_BYTES:
+                self._start()
+        else:
+            self._update(data)
+
+    def _start(self):
+        try:
+            header, rest = parse_container(bytes(self._buffer))
+        except ContainerError:
+            self._active = False
+            return
+        finally:
+            self._buffer = None
+        if header.multi_frame:
+            self._active = False
+            return
+        self._decryptor = TokenDecryptor(self.key, self._pieces.append)
+        self._update(rest)
+
+    def _update(self, data):
+        try:
+            self._decryptor.update(data)
+        except InvalidToken:
+            self._active = False
+            self._pieces = []
+
+    def close(self):
+        if self._active and self._decryptor is None:
+            self._start()
+        if self._active and self._decryptor is not None:
+            try:
+                self._decryptor.finalize()
+                self.plaintext = b''.join(self._pieces)
+            except InvalidToken:
+                pass  # The staged file is decrypted again and reports the error
+        self._pieces = None
+        self._decryptor = None
+        self._active = False
@@ -1,27 +1,169 @@
+import hashlib
+from functools import lru_cache
 import numpy as np
 
-def reverse_shift_pixels(image):
-    pixel_data = np.array(image, dtype=np.int32)
+# Rows per block are chosen so one block of pixels (plus its uint32 luma temporary) stays in L2
+BLOCK_BYTES = 256 * 1024
+
+# Pillow's fixed-point ITU-R 601-2 luma, as used by Image.convert("L")
+_LUMA_R, _LUMA_G, _LUMA_B, _LUMA_ROUND = 19595, 38470, 7471, 0x8000
+
+
+def _block_rows(width, channels):
+    return max(1, BLOCK_BYTES // max(1, width * channels))
+
+
+@lru_cache(maxsize=64)
+def _col_ramp(width):
+    # Per-column part of the shift, shared by every block (and image) of this width
+    ramp = ((-np.arange(width, dtype=np.int64)) & 255).astype(np.uint8)
+    ramp.setflags(write=False)
+    return ramp
+
+
+def prime_shift_tables(widths):
+    """Fill the shift-ramp cache for the given image widths (used by warmup)"""
+    for width in widths:
+        _col_ramp(width)
+
+
+def _shift_block(height, width, row_start, row_end):
+    # shift(index) = (height*width - index) % 256, built in uint8 so wraparound does the modulo
+    col_ramp = _col_ramp(width)
+    bases = ((height * width - np.arange(row_start, row_end, dtype=np.int64) * width) & 255).astype(np.uint8)
+    return bases[:, np.newaxis] + col_ramp[np.newaxis, :]
+
+
+def _luma_histogram(block, luma):
+    # Same rounding as Pillow's convert("L"), so histograms match calculate_entropy exactly
+    np.multiply(block[..., 0], _LUMA_R, out=luma, dtype=np.uint32)
+    luma += block[..., 1].astype(np.uint32) * _LUMA_G
+    luma += block[..., 2].astype(np.uint32) * _LUMA_B
+    luma += _LUMA_ROUND
+    luma >>= 16
+    return np.bincount(luma.ravel(), minlength=256)
+
+
+def _apply_shift(image, sign, histograms=False, output_histogram=True):
+    pixel_data = np.asarray(image, dtype=np.uint8)
     height, width, channels = pixel_data.shape
-    
-    # Create shift values using vectorized operations (MUCH faster than loops)
-    indices = np.arange(height * width).reshape(height, width)
-    shift_vals = (height * width - indices) % 256
-    shift_vals = shift_vals[:, :, np.newaxis]  # Add channel dimension
-    
-    # Apply shift to all pixels at once
-    shifted = (pixel_data + shift_vals) % 256
-    return shifted.astype(np.uint8)
+    output = np.empty_like(pixel_data)
+    hist_before = np.zeros(256, dtype=np.int64) if histograms else None
+    hist_after = np.zeros(256, dtype=np.int64) if histograms and output_histogram else None
+
+    rows = _block_rows(width, channels)
+    luma = np.empty((rows, width), dtype=np.uint32) if histograms else None
+    for row_start in range(0, height, rows):
+        row_end = min(row_start + rows, height)
+        block = pixel_data[row_start:row_end]
+        out_block = output[row_start:row_end]
+        # Repeat across channels so the add runs on contiguous rows instead of a stride-0 broadcast
+        shift_vals = np.repeat(_shift_block(height, width, row_start, row_end), channels, axis=1)
+        shift_vals = shift_vals.reshape(row_end - row_start, width, channels)
+
+        # uint8 add/subtract wraps, which is exactly the % 256 of the original formula
+        if sign > 0:
+            np.add(block, shift_vals, out=out_block)
+        else:
+            np.subtract(block, shift_vals, out=out_block)
+
+        if histograms:
+            block_luma = luma[:row_end - row_start]
+            hist_before += _luma_histogram(block, block_luma)
+            if output_histogram:
+                hist_after += _luma_histogram(out_block, block_luma)
+
+    return output, hist_before, hist_after
+
+
+def shift_pixels_with_histograms(image):
+    """
+    Fused single pass over cache-sized row blocks: returns the shifted image plus the
+    grayscale histograms before and after shifting (input to entropy_from_histogram).
+    Expects an RGB image or HxWx3 uint8 array.
+    """
+    return _apply_shift(image, +1, histograms=True)
+
+
+def reverse_shift_pixels(image):
+    return _apply_shift(image, +1)[0]
+
 
 def reverse_unshift_pixels(image):
-    pixel_data = np.array(image, dtype=np.int32)
+    return _apply_shift(image, -1)[0]
+
+
+def unshift_pixels_with_histogram(image):
+    """Fused unshift that also returns the grayscale histogram of the (still shifted) input"""
+    output, hist_before, _ = _apply_shift(image, -1, histograms=True, output_histogram=False)
+    return output, hist_before
+
+
+def luma_histogram(image, sample_size=None, rng=None):
+    """
+    Grayscale histogram of an RGB image or HxWx3 array, rounded like convert("L").
+    With sample_size below the pixel count, only that many pixels drawn at random
+    (with replacement) are counted. Returns (histogram, sampled).
+    """
+    pixel_data = np.asarray(image, dtype=np.uint8)
     height, width, channels = pixel_data.shape
-    
-    # Create shift values using vectorized operations (MUCH faster than loops)
-    indices = np.arange(height * width).reshape(height, width)
-    shift_vals = (height * width - indices) % 256
-    shift_vals = shift_vals[:, :, np.newaxis]  # Add channel dimension
-    
-    # Apply unshift to all pixels at once
-    unshifted = (pixel_data - shift_vals) % 256
-    return unshifted.astype(np.uint8)
\ No newline at end of file
+    if sample_size is not None and sample_size < height * width:
+        rng = rng or np.random.default_rng()
+        sample = pixel_data.reshape(-1, channels)[rng.integers(0, height * width, size=sample_size)]
+        return _luma_histogram(sample, np.empty(sample_size, dtype=np.uint32)), True
+
+    hist = np.zeros(256, dtype=np.int64)
+    rows = _block_rows(width, channels)
+    luma = np.empty((rows, width), dtype=np.uint32)
+    for row_start in range(0, height, rows):
+        block = pixel_data[row_start:row_start + rows]
+        hist += _luma_histogram(block, luma[:len(block)])
+    return hist, False
+
+
+# Keyed scrambling: contiguous runs of pixels are moved as units so each gather copies
+# a cache-friendly 192-byte row segment; the permutation itself is only n/64 entries.
+PERMUTATION_BLOCK_PIXELS = 64
+GATHER_CHUNK_BLOCKS = 4096
+
+
+def block_permutation(pin, salt, num_blocks):
+    """Deterministic permutation of block indices seeded from the PIN and a per-file salt"""
+    seed = hashlib.sha256(b'pixel-permutation:' + salt + pin.encode()).digest()
+    return np.random.default_rng(int.from_bytes(seed, 'big')).permutation(num_blocks)
+
+
+def _gather_blocks(image, order_for):
+    pixel_data = np.asarray(image, dtype=np.uint8)
+    channels = pixel_data.shape[-1]
+    flat = pixel_data.reshape(-1, channels)
+    num_blocks = len(flat) // PERMUTATION_BLOCK_PIXELS
+    body = num_blocks * PERMUTATION_BLOCK_PIXELS
+
+    output = np.empty_like(pixel_data)
+    out_flat = output.reshape(-1, channels)
+    order = order_for(num_blocks)
+    src_blocks = flat[:body].reshape(num_blocks, PERMUTATION_BLOCK_PIXELS * channels)
+    out_blocks = out_flat[:body].reshape(num_blocks, PERMUTATION_BLOCK_PIXELS * channels)
+
+    # Chunked gathers straight into the output buffer (mode='clip' skips take's out-buffering)
+    for start in range(0, num_blocks, GATHER_CHUNK_BLOCKS):
+        end = min(start + GATHER_CHUNK_BLOCKS, num_blocks)
+        np.take(src_blocks, order[start:end], axis=0, out=out_blocks[start:end], mode='clip')
+
+    # Pixels past the last whole block stay where they are
+    out_flat[body:] = flat[body:]
+    return output
+
+
+def permute_pixels(image, pin, salt):
+    return _gather_blocks(image, lambda num_blocks: block_permutation(pin, salt, num_blocks))
+
+
+def unpermute_pixels(image, pin, salt):
+    def inverse_order(num_blocks):
+        order = block_permutation(pin, salt, num_blocks)
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(num_blocks)
+        return inverse
+    return _gather_blocks(image, inverse_order)
@@ -0,0 +1,100 @@
+"""
+Change the PIN of an encrypted container.
+
+The pixel shift does not depend on the PIN, so the encrypted payload (PNG or
+frame chunks) can be decrypted with the old key and re-encrypted with the new
+one as a byte stream: the header, digest and chunk layout are copied verbatim
+and Pillow/NumPy are never used. Scrambled containers are the exception, since
+their pixel permutation is seeded by the PIN; those are decrypted and
+re-encrypted through the normal pipeline.
+"""
+import os
+import shutil
+import tempfile
+import time
+from container import read_container_header, read_legacy_meta
+from core import decrypt_file, encrypt_file
+from fernet_stream import TokenWriter, decrypt_token_stream, fernet_key_bytes, iter_token_bytes
+from frames import CHUNK_LENGTH
+
+
+def rekey_stream(src, dst, old_pin, new_pin):
+    """
+    Copy a container from src to dst (binary file objects) re-encrypted for new_pin.
+    Raises cryptography.fernet.InvalidToken on a wrong old PIN or tampered input
+    (dst then holds a partial copy and must be discarded), and ValueError for
+    scrambled containers, which need rekey_file.
+    """
+    start = src.tell()
+    header = read_container_header(src)
+    if header.permutation_salt:
+        raise ValueError("Scrambled containers must be re-keyed with rekey_file (the permutation depends on the PIN)")
+    header_size = src.tell() - start
+    src.seek(start)
+    dst.write(src.read(header_size))
+
+    old_key, new_key = fernet_key_bytes(old_pin), fernet_key_bytes(new_pin)
+
+    def rekey_token(length=None):
+        writer = TokenWriter(dst, new_key)
+        decrypt_token_stream(iter_token_bytes(src, length), old_key, writer.write)
+        writer.close()
+
+    if header.multi_frame:
+        # Same plaintext length gives the same token length, so chunk prefixes are copied as-is
+        while True:
+            prefix = src.read(CHUNK_LENGTH.size)
+            if not prefix:
+                break
+            dst.write(prefix)
+            rekey_token(CHUNK_LENGTH.unpack(prefix)[0])
+    else:
+        rekey_token()
+    return header
+
+
+def _rekey_through_pixels(src_path, tmp_path, header, old_pin, new_pin):
+    with tempfile.TemporaryDirectory() as work_dir:
+        stats = decrypt_file(src_path, os.path.join(work_dir, 'plain.png'), old_pin)
+        encrypt_file(stats['output_path'], tmp_path, new_pin, hash_algo=header.hash_algo, scramble=True)
+
+
+def rekey_file(src_path, dst_path, old_pin, new_pin):
+    """
+    Re-key src_path into dst_path (may be the same path; the write is atomic).
+    A legacy .meta sidecar is copied along. Returns stats.
+    """
+    started = time.perf_counter()
+    dst_dir = os.path.dirname(os.path.abspath(dst_path))
+    os.makedirs(dst_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dst_dir, suffix='.tmp')
+    pixel_work = False
+    try:
+        with open(src_path, "rb") as src:
+            header = read_container_header(src)
+            src.seek(0)
+            if header.permutation_salt:
+                os.close(fd)
+                fd = None
+                pixel_work = True
+                _rekey_through_pixels(src_path, tmp_path, header, old_pin, new_pin)
+            else:
+                with os.fdopen(fd, "wb") as dst:
+                    fd = None
+                    rekey_stream(src, dst, old_pin, new_pin)
+        os.replace(tmp_path, dst_path)
+    except Exception:
+        if fd is not None:
+            os.close(fd)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if os.path.abspath(src_path) != os.path.abspath(dst_path) and read_legacy_meta(src_path):
+        shutil.copyfile(src_path + ".meta", dst_path + ".meta")
+    return {
+        'output_path': dst_path,
+        'bytes': os.path.getsize(dst_path),
+        'pixel_work': pixel_work,
+        'seconds': round(time.perf_counter() - started, 4),
+    }
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Production launcher: runs gunicorn with gunicorn.conf.py.
+
+    python serve.py [extra gunicorn args, e.g. --workers 8]
+
+Use run.py / app.py only for local development (they start the Werkzeug dev server).
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Fewer glibc malloc arenas keeps threaded workers from slowly growing RSS;
+    # it must be set before the interpreter starts, hence the exec
+    os.environ.setdefault('MALLOC_ARENA_MAX', '2')
+    os.chdir(BACKEND_DIR)
+    os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', *argv, 'app:app'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import atexit
+import os
+import random
+import sys
+import threading
+from collections import defaultdict
+from datetime import datetime
+from firebase_admin import firestore
+
+# Each user's count is spread over NUM_SHARDS documents under users/{user_id}/counter_shards,
+# so concurrent increments for one user don't contend on a single document's write limit
+SHARD_COLLECTION = 'counter_shards'
+NUM_SHARDS = int(os.getenv('FIREBASE_COUNTER_SHARDS', '10'))
+# When > 0, increments are summed in process and flushed every this many seconds
+FLUSH_INTERVAL = float(os.getenv('FIREBASE_COUNTER_FLUSH_SECONDS', '0'))
+
+
+class ShardedCounter:
+    """
+    Sharded Firestore counter. Works with any client exposing the Firestore API,
+    so it can run against the emulator (FIRESTORE_EMULATOR_HOST) or an in-memory fake.
+    """
+
+    def __init__(self, db, num_shards=NUM_SHARDS, flush_interval=FLUSH_INTERVAL, on_flush=None):
+        self.db = db
+        self.num_shards = num_shards
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop = threading.Event()
+
+    def _shards(self, user_id):
+        return self.db.collection('users').document(user_id).collection(SHARD_COLLECTION)
+
+    def _write(self, user_id, amount):
+        shard = self._shards(user_id).document(str(random.randrange(self.num_shards)))
+        shard.set({'count': firestore.Increment(amount), 'lastActivity': datetime.now()}, merge=True)
+
+    def increment(self, user_id, amount=1):
+        if self.flush_interval <= 0:
+            self._write(user_id, amount)
+            return
+        with self._lock:
+            self._pending[user_id] += amount
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+                atexit.register(self.close)
+
+    def pending(self, user_id):
+        """Locally aggregated increments not yet written to Firestore"""
+        with self._lock:
+            return self._pending.get(user_id, 0)
+
+    def flush(self):
+        """Write every pending delta to one random shard each. Failed deltas are kept for the next flush."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+        for user_id, amount in pending.items():
+            try:
+                self._write(user_id, amount)
+            except Exception as e:
+                print(f"❌ Counter flush failed for {user_id}: {e}", file=sys.stderr, flush=True)
+                with self._lock:
+                    self._pending[user_id] += amount
+                continue
+            if self.on_flush:
+                self.on_flush(user_id)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def read(self, user_id):
+        """Sum the shards. Returns {'count', 'lastActivity'} (lastActivity is None without shards)."""
+        count = 0
+        last_activity = None
+        for doc in self._shards(user_id).stream():
+            shard = doc.to_dict()
+            count += shard.get('count', 0)
+            shard_activity = shard.get('lastActivity')
+            if shard_activity and (last_activity is None or shard_activity > last_activity):
+                last_activity = shard_activity
+        return {'count': count, 'lastActivity': last_activity}
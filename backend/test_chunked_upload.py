@@ -0,0 +1,26 @@
+"""Chunked upload staging. Run with: python -m pytest backend/"""
+import hashlib
+import io
+import pytest
+from werkzeug.wsgi import LimitedStream
+from chunked_upload import ChunkedUploadStore, UploadError
+
+CHUNK_BYTES = 200000
+
+
+def test_disconnect_mid_chunk_keeps_the_committed_offset(tmp_path):
+    store = ChunkedUploadStore(str(tmp_path))
+    upload_id = store.init('photo.png', 2 * CHUNK_BYTES, 'encrypt')['upload_id']
+    chunk = bytes(range(256)) * (CHUNK_BYTES // 256) + bytes(CHUNK_BYTES % 256)
+
+    # The client declared the full chunk but dropped the connection after 120000 bytes
+    short_body = LimitedStream(io.BytesIO(chunk[:120000]), CHUNK_BYTES)
+    with pytest.raises(UploadError) as excinfo:
+        store.append_chunk(upload_id, 0, short_body, CHUNK_BYTES, hashlib.sha256(chunk).hexdigest())
+    assert excinfo.value.status == 422
+    assert excinfo.value.offset == 0
+    assert store.status(upload_id)['offset'] == 0
+
+    # Resuming from the reported offset works
+    result = store.append_chunk(upload_id, 0, io.BytesIO(chunk), CHUNK_BYTES, hashlib.sha256(chunk).hexdigest())
+    assert result['offset'] == CHUNK_BYTES
@@ -0,0 +1,54 @@
+"""Sharded counter against the in-memory Firestore fake. Run with: python -m pytest backend/"""
+import threading
+from firestore_fake import FakeFirestore
+from sharded_counter import SHARD_COLLECTION, ShardedCounter
+
+THREADS = 8
+INCREMENTS = 250
+
+
+def _hammer(increment):
+    """Call increment INCREMENTS times from each of THREADS threads; re-raise the first worker error"""
+    start = threading.Barrier(THREADS)
+    errors = []
+
+    def worker():
+        try:
+            start.wait()
+            for _ in range(INCREMENTS):
+                increment()
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def test_concurrent_increments_are_all_counted():
+    db = FakeFirestore()
+    counter = ShardedCounter(db, num_shards=4, flush_interval=0)
+    _hammer(lambda: counter.increment('alice'))
+
+    assert counter.read('alice')['count'] == THREADS * INCREMENTS
+    shards = list(db.collection('users').document('alice').collection(SHARD_COLLECTION).stream())
+    assert 1 < len(shards) <= 4
+    assert counter.read('bob') == {'count': 0, 'lastActivity': None}
+
+
+def test_batched_increments_are_counted_after_close():
+    db = FakeFirestore()
+    flushed = []
+    counter = ShardedCounter(db, num_shards=4, flush_interval=0.01, on_flush=flushed.append)
+    _hammer(lambda: counter.increment('alice', 2))
+    counter.close()
+
+    assert counter.pending('alice') == 0
+    assert counter.read('alice')['count'] == 2 * THREADS * INCREMENTS
+    assert counter.read('alice')['lastActivity'] is not None
+    assert flushed and set(flushed) == {'alice'}
+
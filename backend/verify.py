@@ -0,0 +1,99 @@
+"""
+PIN and integrity verification without decoding the image.
+
+The Fernet token is base64-decoded and authenticated (HMAC-SHA256) as a stream.
+When there is a digest to compare (embedded header or legacy .meta), the
+ciphertext is also AES-decrypted on the fly and hashed; the PNG is never opened.
+Multi-frame containers are checked chunk by chunk.
+"""
+import json
+import struct
+from cryptography.fernet import InvalidToken
+from container import new_hasher, read_container_header, read_legacy_meta
+from fernet_stream import decrypt_token_stream, fernet_key_bytes, iter_token_bytes
+from frames import CHUNK_LENGTH, FRAME_DURATION
+
+
+class _SkipPrefix:
+    """Sink adapter that drops the first n plaintext bytes (a frame's duration field)"""
+
+    def __init__(self, sink, n):
+        self.sink = sink
+        self.skip = n
+
+    def __call__(self, data):
+        if self.skip:
+            dropped = min(self.skip, len(data))
+            self.skip -= dropped
+            data = data[dropped:]
+        if data:
+            self.sink(data)
+
+
+def _read_chunk_length(fp):
+    prefix = fp.read(CHUNK_LENGTH.size)
+    if len(prefix) != CHUNK_LENGTH.size:
+        raise InvalidToken
+    return CHUNK_LENGTH.unpack(prefix)[0]
+
+
+def verify_container(fp, pin, meta_hash=None, check_digest=True):
+    """
+    Verify an encrypted container read from a binary file object.
+    Returns {'success', 'authenticated', 'integrity_verified', 'hash_algo', 'frames'};
+    integrity_verified is None when there is no digest to compare (or check_digest=False).
+    Raises ContainerError for a malformed header.
+    """
+    header = read_container_header(fp)
+    key = fernet_key_bytes(pin)
+
+    expected = []
+    if check_digest:
+        if header.digest:
+            expected.append((header.hash_algo, header.digest))
+        if meta_hash:
+            expected.append((header.hash_algo or 'sha256', meta_hash))
+    hashers = [new_hasher(algo) for algo, _ in expected]
+
+    def sink(data):
+        for hasher in hashers:
+            hasher.update(data)
+
+    frames = 1
+    try:
+        if header.multi_frame:
+            meta = []
+            decrypt_token_stream(iter_token_bytes(fp, _read_chunk_length(fp)), key, meta.append)
+            frames = json.loads(b''.join(meta))['n_frames']
+            for _ in range(frames):
+                frame_sink = _SkipPrefix(sink, FRAME_DURATION.size) if hashers else None
+                decrypt_token_stream(iter_token_bytes(fp, _read_chunk_length(fp)), key, frame_sink)
+        else:
+            decrypt_token_stream(iter_token_bytes(fp), key, sink if hashers else None)
+    except (InvalidToken, struct.error, ValueError):
+        return {
+            'success': True,
+            'authenticated': False,
+            'integrity_verified': None,
+            'hash_algo': header.hash_algo,
+            'frames': frames,
+            'error': "Wrong PIN or corrupted file",
+        }
+
+    integrity_verified = None
+    if hashers:
+        integrity_verified = all(hasher.hexdigest() == digest for hasher, (_, digest) in zip(hashers, expected))
+    return {
+        'success': True,
+        'authenticated': True,
+        'integrity_verified': integrity_verified,
+        'hash_algo': header.hash_algo or ('sha256' if meta_hash else None),
+        'frames': frames,
+    }
+
+
+def verify_file(path, pin, meta_hash=None, check_digest=True):
+    """verify_container for a path; a legacy .meta sidecar next to it is used if present"""
+    meta_hash = meta_hash or read_legacy_meta(path)
+    with open(path, "rb") as f:
+        return verify_container(f, pin, meta_hash=meta_hash, check_digest=check_digest)
@@ -1,20 +1,71 @@
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
 from PIL import Image, UnidentifiedImageError
 import io
 import os
 import base64
-from pixel_shift import reverse_unshift_pixels
-from key_utils import generate_key_from_pin, get_file_hash, get_file_size_kb, log_event, calculate_entropy
+from pixel_shift import unpermute_pixels
+from key_utils import generate_key_from_pin, get_file_size_kb, log_event
+from entropy_stats import ciphertext_entropy, entropy_fields, get_stats_mode, unshift_with_entropy
+from container import ContainerError, HashingReader, atomic_output, new_hasher, read_container_header, read_legacy_meta
+from admission import AdmissionRejected, estimate_peak_bytes
+from frames import decrypt_frames
+from png_encode import encode_png
 
 # Resolve project root and central uploads directory (shared with encryption)
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 UPLOADS_DIR = os.path.join(ROOT_DIR, 'uploads')
 
-def decrypt_image_web(encrypted_file_path, pin):
+def output_base_name(encrypted_file_path):
+    base_name = os.path.splitext(os.path.basename(encrypted_file_path))[0]
+    if base_name.endswith('_encrypted'):
+        base_name = base_name[:-10]  # Remove '_encrypted' suffix
+    return base_name
+
+def _decrypt_frames_web(f, header, encrypted_file_path, pin, size_before, admission, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    output_base = os.path.join(output_dir, f"{output_base_name(encrypted_file_path)}_decrypted")
+    try:
+        decrypted_path, stats = decrypt_frames(f, header, pin, output_base, admission=admission)
+    except InvalidToken as e:
+        log_event(f"Fernet decryption failed: {str(e)}")
+        return {'success': False, 'error': f'Decryption failed - wrong PIN or corrupted file: {str(e)}'}
+    except ValueError as e:
+        log_event(f"WARNING: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+    with open(decrypted_path, "rb") as decrypted_file:
+        img_base64 = base64.b64encode(decrypted_file.read()).decode('utf-8')
+
+    decrypted_filename = os.path.basename(decrypted_path)
+    log_event(f"Web decryption completed: {decrypted_filename} ({stats['frames']} frames)")
+    return {
+        'success': True,
+        'decrypted_image': img_base64,
+        'decrypted_filename': decrypted_filename,
+        'stats': {
+            'entropy_before': stats['entropy_before'],
+            'entropy_after': stats['entropy_after'],
+            'entropy_margin': stats['entropy_margin'],
+            'stats_mode': stats['stats_mode'],
+            'size_before': size_before,
+            'size_after': get_file_size_kb(decrypted_path),
+            'integrity_verified': bool(stats['integrity_verified']),
+            'frames': stats['frames']
+        }
+    }
+
+def decrypt_image_web(encrypted_file_path, pin, admission=None, plaintext=None, output_dir=None):
     """
     Web-based image decryption function
+    If an AdmissionController is given, the request is admitted against its memory
+    budget using the decrypted PNG header before any pixels are decoded.
+    plaintext is the token already authenticated and decrypted while the upload
+    streamed in; the file is then only read for its header and ciphertext stats.
+    output_dir defaults to uploads/.
     Returns a dictionary with success status and relevant data
     """
+    admitted_cost = 0
+    output_dir = output_dir or UPLOADS_DIR
     try:
         # Normalize input path: we expect app.py to pass something like 'uploads/filename.enc'
         if not os.path.isabs(encrypted_file_path):
@@ -35,62 +86,88 @@ def decrypt_image_web(encrypted_file_path, pin):
         key = generate_key_from_pin(pin)
         fernet = Fernet(key)
 
-        # Read encrypted file
+        size_before = get_file_size_kb(encrypted_file_path)
+
+        # Split off the container header (legacy files are a bare Fernet token)
         with open(encrypted_file_path, "rb") as f:
-            encrypted_data = f.read()
+            try:
+                header = read_container_header(f)
+            except ContainerError as container_error:
+                log_event(f"Invalid container: {str(container_error)}")
+                return {'success': False, 'error': f'Invalid encrypted file: {str(container_error)}'}
 
-        size_before = get_file_size_kb(encrypted_file_path)
+            # Multi-frame containers are decrypted chunk by chunk, one frame in memory at a time
+            if header.multi_frame:
+                return _decrypt_frames_web(f, header, encrypted_file_path, pin, size_before, admission, output_dir)
+
+            # The ciphertext is only needed again for its entropy stats
+            stats_mode = get_stats_mode()
+            token = f.read() if plaintext is None or stats_mode != 'off' else None
 
         # Decrypt data
-        try:
-            decrypted_data = fernet.decrypt(encrypted_data)
-        except Exception as decrypt_error:
-            log_event(f"Fernet decryption failed: {str(decrypt_error)}")
-            return {'success': False, 'error': f'Decryption failed - wrong PIN or corrupted file: {str(decrypt_error)}'}
-        
-        decrypted_hash = get_file_hash(decrypted_data)
+        if plaintext is not None:
+            decrypted_data = plaintext
+        else:
+            try:
+                decrypted_data = fernet.decrypt(token)
+            except Exception as decrypt_error:
+                log_event(f"Fernet decryption failed: {str(decrypt_error)}")
+                return {'success': False, 'error': f'Decryption failed - wrong PIN or corrupted file: {str(decrypt_error)}'}
         
         log_event(f"Web decryption - File: {os.path.basename(encrypted_file_path)}")
-        log_event(f"Post-decryption SHA256: {decrypted_hash}")
-
-        # Verify integrity if meta file exists
-        meta_path = encrypted_file_path + ".meta"
-        integrity_verified = False
-        if os.path.exists(meta_path):
-            with open(meta_path, "r") as meta_file:
-                original_hash = meta_file.read().strip()
-                if original_hash != decrypted_hash:
-                    log_event("WARNING: Decrypted image hash mismatch!")
-                    return {'success': False, 'error': 'Hash mismatch detected! File may be tampered with or wrong PIN used.'}
-                else:
-                    log_event("Image integrity verified successfully.")
-                    integrity_verified = True
-        else:
-            log_event("No .meta file found. Skipping integrity check.")
-
-        # Load and process decrypted image
-        img = Image.open(io.BytesIO(decrypted_data)).convert('RGB')
-        entropy_after = calculate_entropy(img)
 
-        # Reverse pixel shift
-        unshifted_img = reverse_unshift_pixels(img)
+        # Expected digests: embedded header and/or legacy .meta sidecar (SHA-256 for legacy files)
+        meta_hash = read_legacy_meta(encrypted_file_path)
+        expected = []
+        if header.digest:
+            expected.append((header.hash_algo, header.digest))
+        if meta_hash:
+            expected.append((header.hash_algo or 'sha256', meta_hash))
+        if not expected:
+            log_event("No embedded digest or .meta file found. Skipping integrity check.")
+
+        # Load and process decrypted image, hashing the PNG bytes as Pillow reads them
+        reader = HashingReader(io.BytesIO(decrypted_data), [new_hasher(algo) for algo, _ in expected])
+        img = Image.open(reader)
+        if admission is not None:
+            cost = estimate_peak_bytes(img.size, img.mode, 'decrypt')
+            admission.acquire(cost)
+            admitted_cost = cost
+        img = img.convert('RGB')
+        decrypted_hashes = reader.finish()
 
-        # Convert back to base64 for web display
-        output_buffer = io.BytesIO()
-        Image.fromarray(unshifted_img).save(output_buffer, format='PNG')
-        img_base64 = base64.b64encode(output_buffer.getvalue()).decode('utf-8')
+        integrity_verified = False
+        for (algo, expected_hash), decrypted_hash in zip(expected, decrypted_hashes):
+            log_event(f"Post-decryption {algo.upper()}: {decrypted_hash}")
+            if expected_hash != decrypted_hash:
+                log_event("WARNING: Decrypted image hash mismatch!")
+                return {'success': False, 'error': 'Hash mismatch detected! File may be tampered with or wrong PIN used.'}
+        if expected:
+            log_event("Image integrity verified successfully.")
+            integrity_verified = True
+
+        # Entropy of the actual ciphertext bytes and of the decrypted (still shifted) pixels
+        entropy_before = ciphertext_entropy(token, stats_mode)
+        del token
+
+        # Undo the keyed scrambling (if used), then reverse pixel shift
+        if header.permutation_salt:
+            img = unpermute_pixels(img, pin, header.permutation_salt)
+        unshifted_img, entropy_after = unshift_with_entropy(img, stats_mode)
+
+        # Encode once; the same PNG bytes are saved and returned as base64 for web display
+        png_data = encode_png(unshifted_img)
+        del unshifted_img
+        img_base64 = base64.b64encode(png_data).decode('utf-8')
 
         # Generate output filename for decrypted image
-        base_name = os.path.splitext(os.path.basename(encrypted_file_path))[0]
-        if base_name.endswith('_encrypted'):
-            base_name = base_name[:-10]  # Remove '_encrypted' suffix
-        
-        decrypted_filename = f"{base_name}_decrypted.png"
-        os.makedirs(UPLOADS_DIR, exist_ok=True)
-        decrypted_path = os.path.join(UPLOADS_DIR, decrypted_filename)
+        decrypted_filename = f"{output_base_name(encrypted_file_path)}_decrypted.png"
+        os.makedirs(output_dir, exist_ok=True)
+        decrypted_path = os.path.join(output_dir, decrypted_filename)
         
         # Save decrypted image file
-        Image.fromarray(unshifted_img).save(decrypted_path)
+        with atomic_output(decrypted_path) as decrypted_file:
+            decrypted_file.write(png_data)
         size_after = get_file_size_kb(decrypted_path)
 
         # Note: File cleanup will be handled by Flask app after response is sent
@@ -103,14 +180,16 @@ def decrypt_image_web(encrypted_file_path, pin):
             'decrypted_image': img_base64,
             'decrypted_filename': decrypted_filename,
             'stats': {
-                'entropy_before': 8.0,  # Approximate for encrypted data
-                'entropy_after': entropy_after,
+                **entropy_fields(stats_mode, entropy_before, entropy_after),
                 'size_before': size_before,
                 'size_after': size_after,
                 'integrity_verified': integrity_verified
             }
         }
 
+    except AdmissionRejected as e:
+        log_event(f"Web decryption rejected: {str(e)}")
+        return {'success': False, 'error': str(e), 'overloaded': True, 'retry_after': e.retry_after}
     except UnidentifiedImageError as e:
         error_msg = f"Invalid image or wrong PIN: {str(e)}"
         log_event(f"Web decryption failed: {error_msg}")
@@ -119,3 +198,6 @@ def decrypt_image_web(encrypted_file_path, pin):
         error_msg = f"Unexpected error: {str(e)}"
         log_event(f"Web decryption failed: {error_msg}")
         return {'success': False, 'error': error_msg}
+    finally:
+        if admitted_cost:
+            admission.release(admitted_cost)
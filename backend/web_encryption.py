@@ -3,19 +3,56 @@ import io
 import os
 import base64
 from PIL import Image
-from pixel_shift import reverse_shift_pixels
-from key_utils import generate_key_from_pin, get_file_hash, log_event, calculate_entropy, get_file_size_kb
+from pixel_shift import permute_pixels
+from key_utils import generate_key_from_pin, log_event, get_file_size_kb
+from entropy_stats import shift_with_entropy
+from container import DEFAULT_HASH_ALGO, PERMUTATION_SALT_BYTES, HashingWriter, new_hasher, write_container
+from admission import AdmissionRejected, estimate_peak_bytes
+from frames import encrypt_frames, is_multi_frame
 
 # Resolve absolute uploads path from project root
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 UPLOADS_DIR = os.path.join(ROOT_DIR, 'uploads')
 
-def encrypt_image_web(image_path, pin):
+def _encrypt_frames_web(image, image_path, pin, hash_algo, scramble, output_dir):
+    import sys
+    print(f"🎞️ [ENCRYPT] Streaming {image.n_frames} frames...", file=sys.stderr, flush=True)
+    size_before = get_file_size_kb(image_path)
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    encrypted_filename = f"{base_name}_encrypted.enc"
+    encrypted_path = os.path.join(output_dir, encrypted_filename)
+    os.makedirs(output_dir, exist_ok=True)
+
+    stats = encrypt_frames(image, pin, encrypted_path, hash_algo=hash_algo, scramble=scramble)
+    log_event(f"Web encryption - Image: {os.path.basename(image_path)} ({stats['frames']} frames)")
+    log_event(f"Pre-encryption {hash_algo.upper()}: {stats['original_hash']}")
+    log_event(f"Web encryption completed: {encrypted_filename}")
+
+    stats.update({'size_before': size_before, 'size_after': get_file_size_kb(encrypted_path)})
+    return {
+        'success': True,
+        'encrypted_filename': encrypted_filename,
+        'stats': stats
+    }
+
+def encrypt_image_web(image_path, pin, hash_algo=DEFAULT_HASH_ALGO, write_meta=False, admission=None, scramble=False,
+                      image=None, output_dir=None):
     """
     Web-based image encryption function
+    scramble=True adds a PIN-seeded block permutation of pixel positions after the shift.
+    The integrity digest is computed while the PNG is encoded and embedded in the
+    container header; set write_meta=True to also emit a legacy .meta sidecar
+    (named by meta_filename in the result, which is otherwise absent).
+    If an AdmissionController is given, the request is admitted against its memory
+    budget using the image header before any pixels are decoded.
+    image is the upload already decoded while it streamed in (admitted by the caller);
+    image_path is then only used for naming and size stats.
+    output_dir defaults to uploads/.
     Returns a dictionary with success status and relevant data
     """
     import sys
+    admitted_cost = 0
+    output_dir = output_dir or UPLOADS_DIR
     try:
         print(f"🔍 [ENCRYPT] Starting with image_path: {image_path}", file=sys.stderr, flush=True)
         
@@ -29,36 +66,49 @@ def encrypt_image_web(image_path, pin):
             return {'success': False, 'error': 'PIN is required'}
 
         print(f"✅ [ENCRYPT] File exists, loading image...", file=sys.stderr, flush=True)
+        # Read dimensions lazily and admit before decoding
+        streamed = image is not None
+        if not streamed:
+            image = Image.open(image_path)
+        if admission is not None and not streamed:
+            cost = estimate_peak_bytes(image.size, image.mode, 'encrypt')
+            admission.acquire(cost)
+            admitted_cost = cost
+
+        # Animated GIF/APNG and multi-page TIFF: stream frames instead of keeping only the first
+        if is_multi_frame(image):
+            return _encrypt_frames_web(image, image_path, pin, hash_algo, scramble, output_dir)
+
         # Load and process image
-        image = Image.open(image_path).convert('RGB')
+        image = image.convert('RGB')
         print(f"✅ [ENCRYPT] Image loaded: {image.size}", file=sys.stderr, flush=True)
         
-        entropy_before = calculate_entropy(image)
-        print(f"✅ [ENCRYPT] Entropy calculated: {entropy_before}", file=sys.stderr, flush=True)
-        
         size_before = get_file_size_kb(image_path)
         print(f"✅ [ENCRYPT] Size before: {size_before}KB", file=sys.stderr, flush=True)
 
-        # Apply pixel shift
+        # Apply pixel shift; entropy per STATS_MODE (exact mode fuses both histograms into the pass)
         print(f"🔄 [ENCRYPT] Applying pixel shift...", file=sys.stderr, flush=True)
-        shifted_img = reverse_shift_pixels(image)
-        entropy_after = calculate_entropy(Image.fromarray(shifted_img))
-        print(f"✅ [ENCRYPT] Pixel shift complete, entropy: {entropy_after}", file=sys.stderr, flush=True)
+        shifted_img, entropy = shift_with_entropy(image)
+        print(f"✅ [ENCRYPT] Pixel shift complete, entropy: {entropy['entropy_before']} -> {entropy['entropy_after']}", file=sys.stderr, flush=True)
+
+        permutation_salt = None
+        if scramble:
+            print(f"🔀 [ENCRYPT] Scrambling pixel positions...", file=sys.stderr, flush=True)
+            permutation_salt = os.urandom(PERMUTATION_SALT_BYTES)
+            shifted_img = permute_pixels(shifted_img, pin, permutation_salt)
 
-        # Convert to bytes
+        # Convert to bytes, hashing incrementally as the PNG encoder writes
         print(f"📦 [ENCRYPT] Converting to bytes...", file=sys.stderr, flush=True)
         buffer = io.BytesIO()
-        Image.fromarray(shifted_img).save(buffer, format='PNG')
+        hasher = new_hasher(hash_algo)
+        Image.fromarray(shifted_img).save(HashingWriter(buffer, hasher), format='PNG')
         img_bytes = buffer.getvalue()
+        original_hash = hasher.hexdigest()
         print(f"✅ [ENCRYPT] Image converted to bytes: {len(img_bytes)} bytes", file=sys.stderr, flush=True)
-
-        # Generate hash for integrity
-        print(f"🔐 [ENCRYPT] Generating hash...", file=sys.stderr, flush=True)
-        original_hash = get_file_hash(img_bytes)
-        print(f"✅ [ENCRYPT] Hash: {original_hash[:16]}...", file=sys.stderr, flush=True)
+        print(f"✅ [ENCRYPT] Hash ({hash_algo}): {original_hash[:16]}...", file=sys.stderr, flush=True)
         
         log_event(f"Web encryption - Image: {os.path.basename(image_path)}")
-        log_event(f"Pre-encryption SHA256: {original_hash}")
+        log_event(f"Pre-encryption {hash_algo.upper()}: {original_hash}")
         print(f"✅ [ENCRYPT] Logged events", file=sys.stderr, flush=True)
 
         # Encrypt data
@@ -74,36 +124,40 @@ def encrypt_image_web(image_path, pin):
         # Generate filename for encrypted file
         base_name = os.path.splitext(os.path.basename(image_path))[0]
         encrypted_filename = f"{base_name}_encrypted.enc"
-        encrypted_path = os.path.join(UPLOADS_DIR, encrypted_filename)
+        encrypted_path = os.path.join(output_dir, encrypted_filename)
         
-        # Save encrypted file
-        os.makedirs(UPLOADS_DIR, exist_ok=True)
-        with open(encrypted_path, "wb") as f:
-            f.write(encrypted_data)
+        # Save encrypted container (header carries the integrity digest)
+        os.makedirs(output_dir, exist_ok=True)
+        write_container(encrypted_path, hash_algo, original_hash, encrypted_data, permutation_salt)
         
         size_after = get_file_size_kb(encrypted_path)
 
-        # Save meta file
-        meta_path = encrypted_path + ".meta"
-        with open(meta_path, "w") as meta_file:
-            meta_file.write(original_hash)
-
         log_event(f"Web encryption completed: {encrypted_filename}")
-        log_event(f"Hash saved to: {meta_path}")
-
-        return {
+        result = {
             'success': True,
             'encrypted_filename': encrypted_filename,
-            'meta_filename': os.path.basename(meta_path),
             'stats': {
-                'entropy_before': entropy_before,
-                'entropy_after': entropy_after,
+                **entropy,
                 'size_before': size_before,
                 'size_after': size_after,
-                'original_hash': original_hash
+                'original_hash': original_hash,
+                'hash_algo': hash_algo,
+                'scrambled': scramble
             }
         }
 
+        # Legacy meta sidecar, only when explicitly requested (meta_filename only names a file that exists)
+        if write_meta:
+            meta_path = encrypted_path + ".meta"
+            with open(meta_path, "w") as meta_file:
+                meta_file.write(original_hash)
+            log_event(f"Hash saved to: {meta_path}")
+            result['meta_filename'] = os.path.basename(meta_path)
+        return result
+
+    except AdmissionRejected as e:
+        log_event(f"Web encryption rejected: {str(e)}")
+        return {'success': False, 'error': str(e), 'overloaded': True, 'retry_after': e.retry_after}
     except Exception as e:
         import sys
         error_msg = f"Web encryption failed: {str(e)}"
@@ -114,3 +168,6 @@ def encrypt_image_web(image_path, pin):
         print(f"{'='*60}\n", file=sys.stderr, flush=True)
         log_event(error_msg)
         return {'success': False, 'error': str(e)}
+    finally:
+        if admitted_cost:
+            admission.release(admitted_cost)
@@ -140,13 +140,13 @@ encryptForm.addEventListener('submit', async function(e) {
             showResult(encryptResult, `
                 ✅ <strong>Encryption Successful!</strong><br>
                 📁 Encrypted file: ${data.encrypted_filename}<br>
-                🔑 Hash file: ${data.meta_filename}<br>
+                ${data.meta_filename ? `🔑 Hash file: ${data.meta_filename}<br>` : ''}
                 <div style="margin-top: 15px;">
                     <a href="/download/${data.encrypted_filename}" class="download-link">📥 Download Encrypted File</a>
-                    <a href="/download/${data.meta_filename}" class="download-link" style="margin-left: 10px;">📄 Download Hash File</a>
+                    ${data.meta_filename ? `<a href="/download/${data.meta_filename}" class="download-link" style="margin-left: 10px;">📄 Download Hash File</a>` : ''}
                 </div>
                 <div style="margin-top: 10px; padding: 10px; background: #e6f3ff; border-radius: 5px; font-size: 14px;">
-                    💡 <strong>Important:</strong> Keep both files together for decryption and integrity verification.<br>
+                    💡 <strong>Important:</strong> The integrity hash is embedded in the encrypted file; keep it safe for decryption.<br>
                     🔐 <strong>Security:</strong> Don't share your PIN with anyone you don't trust completely.
                 </div>
             `);
@@ -214,8 +214,9 @@ decryptForm.addEventListener('submit', async function(e) {
 
 // Display Statistics
 function displayStats(stats, operation) {
-    document.getElementById('entropyBefore').textContent = stats.entropy_before.toFixed(4);
-    document.getElementById('entropyAfter').textContent = stats.entropy_after.toFixed(4);
+    // Entropy is null when the server runs with STATS_MODE=off
+    document.getElementById('entropyBefore').textContent = stats.entropy_before != null ? stats.entropy_before.toFixed(4) : '-';
+    document.getElementById('entropyAfter').textContent = stats.entropy_after != null ? stats.entropy_after.toFixed(4) : '-';
     document.getElementById('sizeBefore').textContent = stats.size_before;
     document.getElementById('sizeAfter').textContent = stats.size_after;
     